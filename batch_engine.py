@@ -0,0 +1,251 @@
+# batch_engine.py
+import math
+
+import numpy as np
+
+from torch_network import TorchSteeringPopulation
+from observation import knearest_input_dim, nearest_slots, wrapped_offset
+
+
+class BatchWorld:
+    '''Runs N independent games in lockstep, one world per player.
+
+    Positions, levels and sizes for all worlds live in numpy arrays and are
+    advanced together every tick. The rules follow ``view.App``: collisions use
+    the same 25px eat / 12px hit radii, eaten particles respawn uniformly and
+    a world stops when its player reaches level 0.
+
+    With ``batched_networks`` the players' TorchSteeringNets are trained as one
+    ``TorchSteeringPopulation`` instead of one ``train_step`` call per player.
+    With ``k_nearest`` the inputs are the k nearest particles and killers, as
+    in ``observation.KNearestEncoder``.
+    '''
+    # Arena plays everyone in one world: the entity arrays then hold a single row
+    shared_world = False
+
+    def __init__(self, players, n_particles, n_killers, window_dim, eta, round_limit=1000, old_network=False,
+                 batched_networks=False, k_nearest=None):
+        self.windowWidth, self.windowHeight = window_dim
+        self.players = players
+        self.n_worlds = len(players)
+        self.n_particles = n_particles
+        self.n_killers = n_killers
+        self.n_cells = 1 + n_particles + n_killers
+        self.eta = eta
+        self.round_limit = round_limit
+        self.round_count = 0
+        self.old_network = old_network
+        self.diag = math.hypot(self.windowWidth, self.windowHeight)
+        self.k_nearest = k_nearest
+        self.population = None
+        if batched_networks and not old_network:
+            self.population = TorchSteeringPopulation([p.network for p in players])
+
+        n = self.n_worlds
+        W, H = self.windowWidth, self.windowHeight
+        # Players
+        self.x = np.array([p.x for p in players], dtype=np.float64)
+        self.y = np.array([p.y for p in players], dtype=np.float64)
+        self.speed = np.array([p.speed for p in players], dtype=np.float64)
+        self.level = np.array([p.level for p in players], dtype=np.int64)
+        self.size = np.array([p.size for p in players], dtype=np.int64)
+        self.fill = np.array([p.fill for p in players], dtype=np.int64)
+        self.R = np.array([p.R for p in players], dtype=np.int64)
+        self.G = np.array([p.G for p in players], dtype=np.int64)
+        self.B = np.array([p.B for p in players], dtype=np.int64)
+        self.level_data = [list(p.level_data) for p in players]
+        self.alive = self.level != 0
+        # Particles and killers, spawned like model.Particle / model.Killer
+        rows = 1 if self.shared_world else n
+        self.particle_x = np.random.randint(20, W - 20 + 1, size=(rows, n_particles)).astype(np.float64)
+        self.particle_y = np.random.randint(0, H + 1, size=(rows, n_particles)).astype(np.float64)
+        self.killer_x = np.random.randint(int(W - W * 0.2), W + 1, size=(rows, n_killers)).astype(np.float64)
+        self.killer_y = np.random.randint(0, H + 1, size=(rows, n_killers)).astype(np.float64)
+        self.killer_level = np.ones((rows, n_killers), dtype=np.int64)
+
+    def _record(self, mask):
+        for i in np.flatnonzero(mask):
+            self.level_data[i].append(int(self.level[i]))
+
+    def level_up(self, mask):
+        '''Vectorized ``Player.level_up`` for the worlds in ``mask``.'''
+        mask = mask & (self.B != 255)
+        self.level[mask] += 1
+        self._record(mask)
+        tens = mask & (self.level % 10 == 0)
+        grow = tens & (self.size < 10)
+        self.size[grow] += 1
+        thicken = tens & ~grow & (self.fill < 10)
+        self.fill[thicken] += 1
+        fade = tens & ~grow & ~thicken & (self.R > 10)
+        self.R[fade] -= 2
+        self.G[fade] -= 2
+        maxed = tens & ~grow & ~thicken & ~fade
+        self.R[maxed] = 0
+        self.B[maxed] = 255
+
+    def level_down(self, mask, num):
+        '''Vectorized ``Player.level_down`` for the worlds in ``mask``.'''
+        mask = mask & (self.level != 0)
+        self.level[mask] = np.maximum(self.level[mask] - num[mask], 0)
+        self._record(mask)
+        brighten = mask & (self.R < 250)
+        self.R[brighten] += 2
+        self.G[brighten] += 2
+        thin = mask & ~brighten & (self.fill > 1)
+        self.fill[thin] -= 1
+        shrink = mask & ~brighten & ~thin & (self.size > 3)
+        self.size[shrink] -= 1
+        rest = mask & ~brighten & ~thin & ~shrink
+        self.B[rest] = 0
+
+    def _eat(self, px, py, alive):
+        '''(N, n_particles) mask of the particles each player eats, respawned.'''
+        eaten = alive & (np.hypot(px - self.particle_x, py - self.particle_y) < 25)
+        n_eaten = int(eaten.sum())
+        if n_eaten:
+            self.particle_x[eaten] = np.random.randint(0, self.windowWidth + 1, size=n_eaten)
+            self.particle_y[eaten] = np.random.randint(0, self.windowHeight + 1, size=n_eaten)
+        return eaten
+
+    def _update_npc_positions(self):
+        '''Collisions, respawns and network inputs for every world at once.
+
+        Returns ``(coord_array, y_target)`` with shapes ``(N, 2*n_cells)`` and
+        ``(N, 2)``; row i matches what ``App._update_npc_positions`` builds.
+        '''
+        alive = self.alive[:, None]
+        px, py = self.x[:, None], self.y[:, None]
+
+        eaten = self._eat(px, py, alive)
+        counts = eaten.sum(axis=1)
+        for r in range(counts.max(initial=0)):
+            self.level_up(counts > r)
+
+        hit = alive & (np.hypot(px - self.killer_x, py - self.killer_y) < 12)
+        for j in np.flatnonzero(hit.any(axis=0)):
+            self.level_down(hit[:, j], np.broadcast_to(self.killer_level[:, j], self.n_worlds))
+
+        if self.k_nearest is None:
+            # (1, n) rows of a shared world broadcast against every player
+            dx = np.concatenate((self.particle_x, self.killer_x), axis=1)
+            dy = np.concatenate((self.particle_y, self.killer_y), axis=1)
+            dx = (dx - px) / self.diag
+            dy = (dy - py) / self.diag
+            scores = np.concatenate((np.where(eaten, 1.0, 0.1), np.where(hit, -1.0, -0.2)), axis=1)
+            input_dim = 2 * self.n_cells
+        else:
+            dx, dy, scores = self._nearest_entities(px, py, eaten, hit)
+            input_dim = knearest_input_dim(self.k_nearest)
+
+        coord_array = np.empty((self.n_worlds, input_dim), dtype=np.float32)
+        coord_array[:, 0] = self.x / self.windowWidth
+        coord_array[:, 1] = self.y / self.windowHeight
+        coord_array[:, 2::2] = dx
+        coord_array[:, 3::2] = dy
+
+        total = np.abs(scores).sum(axis=1) + 1e-6
+        dx_target = (dx * scores).sum(axis=1) / total
+        dy_target = (dy * scores).sum(axis=1) / total
+        norm = np.hypot(dx_target, dy_target) + 1e-6
+        y_target = np.stack((dx_target / norm, dy_target / norm), axis=1).astype(np.float32)
+
+        return coord_array, y_target
+
+    def _nearest_entities(self, px, py, eaten, hit):
+        '''Wrapped offsets and target scores of the k nearest particles and killers.'''
+        parts = []
+        for ex, ey, touched, score_hit, score_far in (
+            (self.particle_x, self.particle_y, eaten, 1.0, 0.1),
+            (self.killer_x, self.killer_y, hit, -1.0, -0.2),
+        ):
+            dx = wrapped_offset(ex - px, self.windowWidth)
+            dy = wrapped_offset(ey - py, self.windowHeight)
+            dx, dy, index, valid = nearest_slots(dx, dy, self.k_nearest)
+            touched = np.take_along_axis(touched, index, axis=1) if touched.shape[1] else np.zeros_like(valid)
+            scores = np.where(valid, np.where(touched, score_hit, score_far), 0.0)
+            parts.append((dx / self.diag, dy / self.diag, scores))
+        return tuple(np.concatenate(arrays, axis=1) for arrays in zip(*parts))
+
+    def _run_networks(self, coord_array, y_target):
+        '''Train every live player's network on its own world and move it.'''
+        if self.population is not None:
+            pred = self.population.train_step(coord_array, y_target, self.alive).astype(np.float64)
+            self._move_players(pred)
+            return
+        pred = np.zeros((self.n_worlds, 2), dtype=np.float64)
+        for i in np.flatnonzero(self.alive):
+            network = self.players[i].network
+            if self.old_network:
+                activations = network.SGD((coord_array[i][:, None], y_target[i][:, None]), 1, 1, self.eta)
+                pred[i] = activations.ravel()
+            else:
+                pred[i] = network.train_step(coord_array[i], y_target[i])
+        self._move_players(pred)
+
+    def _move_players(self, pred, explore=True):
+        # Add small exploration noise (5%), unless the caller does its own exploring
+        if explore:
+            explore = self.alive & (np.random.rand(self.n_worlds) < 0.05)
+            n_explore = int(explore.sum())
+            if n_explore:
+                pred[explore] += np.random.uniform(-0.3, 0.3, size=(n_explore, 2))
+
+        # Normalize prediction by ITS OWN norm
+        pred /= np.hypot(pred[:, 0], pred[:, 1])[:, None] + 1e-6
+
+        alive = self.alive
+        self.x[alive] = (self.x[alive] + self.speed[alive] * pred[alive, 0]) % self.windowWidth
+        self.y[alive] = (self.y[alive] + self.speed[alive] * pred[alive, 1]) % self.windowHeight
+
+    def step(self):
+        coord_array, y_target = self._update_npc_positions()
+        self._run_networks(coord_array, y_target)
+        self.alive &= self.level != 0
+        self.round_count += 1
+
+    def sync_players(self):
+        '''Write the array state back onto the ``Player`` objects.'''
+        if self.population is not None:
+            self.population.sync()
+        for i, player in enumerate(self.players):
+            player.x = float(self.x[i])
+            player.y = float(self.y[i])
+            player.level = int(self.level[i])
+            player.size = int(self.size[i])
+            player.fill = int(self.fill[i])
+            player.R = int(self.R[i])
+            player.G = int(self.G[i])
+            player.B = int(self.B[i])
+            player.level_data = self.level_data[i]
+
+    def run(self):
+        while self.round_count < self.round_limit and self.alive.any():
+            self.step()
+        self.sync_players()
+
+
+class Arena(BatchWorld):
+    '''Runs many players in one shared world, competing for the same particles.
+
+    Same rules, networks and inputs as BatchWorld, but the particles and
+    killers exist once, as (1, n) rows that broadcast against every player,
+    so collisions and observations for the whole population are one pass
+    over (players, entities) arrays per tick. A particle in reach of several
+    players goes to the nearest of them (the lowest index on ties) and
+    respawns once; a killer hits everyone who touches it. Players don't see
+    or collide with each other. Fitness is each player's ``level_data``.
+    '''
+    shared_world = True
+
+    def _eat(self, px, py, alive):
+        distance = np.hypot(px - self.particle_x, py - self.particle_y)
+        in_reach = alive & (distance < 25)
+        eaten = np.zeros_like(in_reach)
+        contested = np.flatnonzero(in_reach.any(axis=0))
+        if len(contested):
+            distance = np.where(in_reach[:, contested], distance[:, contested], np.inf)
+            eaten[distance.argmin(axis=0), contested] = True
+            self.particle_x[0, contested] = np.random.randint(0, self.windowWidth + 1, size=len(contested))
+            self.particle_y[0, contested] = np.random.randint(0, self.windowHeight + 1, size=len(contested))
+        return eaten
@@ -0,0 +1,653 @@
+# benchmark.py
+import argparse
+import json
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from itertools import product
+
+import numpy as np
+import torch
+
+import dashboard
+from view import App
+from batch_engine import BatchWorld, Arena
+from model import Particle, Killer, Player, brownian_motion
+from network import Network
+from genome import GenomePopulation
+from torch_network import TorchSteeringNet, TorchNetConfig, export_numpy_policy
+from numpy_policy import NumpyPolicy
+from reinforce import ReinforceConfig, ReinforceTrainer
+from render import RenderThread, RenderProcess, ImageSink
+from dashboard import (
+    Config, get_player, get_npcs, create_children, run_simulation_batch, run_simulation_round,
+    run_simulation_halving, select_survivors,
+)
+
+BASELINE_PATH = 'benchmark_baseline.json'
+
+
+def _sequential_apps(players, conf):
+    apps = []
+    for player in players:
+        particle_list, killer_list = get_npcs(conf)
+        apps.append(App(
+            player, particle_list, killer_list, conf.window_dim, conf.eta, tick_rate=conf.tick_rate,
+            round_limit=conf.round_limit, render=False, old_network=conf.old_network, spatial_grid=conf.spatial_grid,
+            k_nearest=conf.k_nearest,
+        ))
+    return apps
+
+
+def _lockstep_world(players, conf, world_type=BatchWorld):
+    return world_type(
+        players, conf.number_of_particles, conf.number_of_killers, conf.window_dim,
+        conf.eta, conf.round_limit, conf.old_network, conf.batched_networks, conf.k_nearest,
+    )
+
+
+def bench_lockstep(n_players=120, round_limit=300):
+    '''Steps/sec of sequential ``App`` rounds vs one ``BatchWorld``, with networks training.'''
+    conf = Config()
+    conf.round_limit = round_limit
+
+    apps = _sequential_apps([get_player(conf) for _ in range(n_players)], conf)
+    start = time.perf_counter()
+    for A in apps:
+        A.run()
+    app_time = time.perf_counter() - start
+    app_steps = sum(A.round_count for A in apps)
+
+    results = {'app_steps_per_sec': app_steps / app_time}
+    for key, batched in (('lockstep_steps_per_sec', False), ('batched_steps_per_sec', True)):
+        conf.batched_networks = batched
+        world = _lockstep_world([get_player(conf) for _ in range(n_players)], conf)
+        start = time.perf_counter()
+        world.run()
+        results[key] = world.round_count * n_players / (time.perf_counter() - start)
+    return results
+
+
+def bench_arena(n_players=120, round_limit=300, entity_counts=((3, 2), (300, 200))):
+    '''Player steps/sec and mean max level, a BatchWorld per player vs one shared Arena (batched networks).'''
+    results = {}
+    for (n_particles, n_killers), world_type in product(entity_counts, (BatchWorld, Arena)):
+        conf = Config()
+        conf.round_limit = round_limit
+        conf.number_of_particles = n_particles
+        conf.number_of_killers = n_killers
+        conf.k_nearest = 3
+        conf.batched_networks = True
+        world = _lockstep_world([get_player(conf) for _ in range(n_players)], conf, world_type)
+        start = time.perf_counter()
+        world.run()
+        name = f'{world_type.__name__.lower()}[p{n_particles}_k{n_killers}]'
+        results[f'{name}_steps_per_sec'] = world.round_count * n_players / (time.perf_counter() - start)
+        results[f'{name}_max_level'] = float(np.mean([max(levels, default=0) for levels in world.level_data]))
+    return results
+
+
+def bench_world_only(n_players=120, ticks=300):
+    '''Steps/sec of the game logic alone (collisions, inputs, moves), networks excluded.'''
+    conf = Config()
+    conf.round_limit = ticks
+
+    apps = _sequential_apps([get_player(conf) for _ in range(n_players)], conf)
+    start = time.perf_counter()
+    for A in apps:
+        for _ in range(ticks):
+            A._update_npc_positions()
+    app_time = time.perf_counter() - start
+
+    world = _lockstep_world([get_player(conf) for _ in range(n_players)], conf)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        world._update_npc_positions()
+        world._move_players(np.random.uniform(-1, 1, size=(n_players, 2)))
+    world_time = time.perf_counter() - start
+
+    steps = n_players * ticks
+    return {
+        'app_steps_per_sec': steps / app_time,
+        'lockstep_steps_per_sec': steps / world_time,
+    }
+
+
+def compare_statistics(n_games=60, round_limit=2000):
+    '''Mean final level, max level and survival rate for both engines on fresh players.'''
+    conf = Config()
+    conf.round_limit = round_limit
+
+    app_players = [get_player(conf) for _ in range(n_games)]
+    for A in _sequential_apps(app_players, conf):
+        A.run()
+    world_players = [get_player(conf) for _ in range(n_games)]
+    _lockstep_world(world_players, conf).run()
+
+    stats = {}
+    for name, players in (('app', app_players), ('lockstep', world_players)):
+        final = np.array([p.level for p in players], dtype=float)
+        peak = np.array([max(p.level_data) if p.level_data else p.level for p in players], dtype=float)
+        stats[name] = {
+            'final_level': (final.mean(), final.std() / np.sqrt(n_games)),
+            'max_level': (peak.mean(), peak.std() / np.sqrt(n_games)),
+            'survival': float((final > 0).mean()),
+        }
+    return stats
+
+
+def bench_spatial_grid(entity_counts=(5, 50, 500, 5000, 10000), ticks=200):
+    '''Collision-check ticks/sec as the entity count grows, linear scan vs spatial grid.
+
+    Entities are split 60/40 between particles and killers and the player
+    takes a random step every tick.
+    '''
+    conf = Config()
+    results = []
+    for n in entity_counts:
+        n_particles = max(1, n * 3 // 5)
+        particles = [Particle(f'particle_{i}', conf.window_dim) for i in range(n_particles)]
+        killers = [Killer(f'killer_{i}', conf.window_dim) for i in range(n - n_particles)]
+        row = {'entities': n}
+        for key, spatial_grid in (('linear_ticks_per_sec', False), ('grid_ticks_per_sec', True)):
+            player = get_player(conf)
+            A = App(player, particles, killers, conf.window_dim, conf.eta, tick_rate=conf.tick_rate,
+                    round_limit=ticks, render=False, old_network=conf.old_network, spatial_grid=spatial_grid)
+            start = time.perf_counter()
+            for _ in range(ticks):
+                A._check_collisions()
+                angle = np.random.uniform(0, 2 * np.pi)
+                player.x = (player.x + player.speed * np.cos(angle)) % conf.windowWidth
+                player.y = (player.y + player.speed * np.sin(angle)) % conf.windowHeight
+            row[key] = ticks / (time.perf_counter() - start)
+        results.append(row)
+    return results
+
+
+def bench_entity_store(entity_counts=(1000, 10000, 50000), ticks=100, k_nearest=3):
+    '''Bytes per entity and observation ticks/sec, Particle/Killer objects vs model.EntityStore.
+
+    Uses the k-nearest observation so the network input stays the same
+    size; the object entities go through the spatial grids, the store
+    through whole-array offsets. The network itself is not run.
+    '''
+    conf = Config()
+    results = []
+    for n in entity_counts:
+        n_particles = n * 3 // 5
+        row = {'entities': n}
+        for name, entity_store in (('objects', False), ('store', True)):
+            conf.number_of_particles = n_particles
+            conf.number_of_killers = n - n_particles
+            conf.entity_store = entity_store
+            tracemalloc.start()
+            particles, killers = get_npcs(conf)
+            row[f'{name}_bytes_per_entity'] = tracemalloc.get_traced_memory()[0] / n
+            tracemalloc.stop()
+            A = App(get_player(conf), particles, killers, conf.window_dim, conf.eta, tick_rate=conf.tick_rate,
+                    round_limit=ticks, render=False, old_network=conf.old_network, k_nearest=k_nearest)
+            start = time.perf_counter()
+            for _ in range(ticks):
+                A._update_npc_positions()
+            row[f'{name}_ticks_per_sec'] = ticks / (time.perf_counter() - start)
+        results.append(row)
+    return results
+
+
+def bench_successive_halving(n_players=60, round_limit=3000, level_cutoff=25, seed=0):
+    '''Ticks played and survivors of one batch, full rounds vs successive halving, on copies of the same players.
+
+    ``full_repeat`` plays the full rounds again with another seed: how many
+    survivors two full evaluations share is the noise floor for
+    ``shared_survivors`` between the full and the halving evaluation.
+    '''
+    conf = Config()
+    conf.round_limit = round_limit
+    conf.profile = True
+    players = [get_player(conf) for _ in range(n_players)]
+
+    results = {}
+    for name, run_seed in (('full', seed), ('full_repeat', seed + 1), ('halving', seed)):
+        population = [Player(conf.window_dim, p.network.copy(), conf.use_network) for p in players]
+        random.seed(run_seed)
+        np.random.seed(run_seed)
+        torch.manual_seed(run_seed)
+        start = time.perf_counter()
+        if name == 'halving':
+            finished, profiles = run_simulation_halving(population, level_cutoff, conf)
+        else:
+            finished, profiles = population, [run_simulation_round(p, conf) for p in population]
+        results[f'{name}_sec'] = time.perf_counter() - start
+        results[f'{name}_ticks'] = sum(profile['ticks'] for profile in profiles)
+        survivors = {id(p) for p in select_survivors(finished, level_cutoff)}
+        results[f'{name}_survivors'] = [i for i, p in enumerate(population) if id(p) in survivors]
+    full = set(results['full_survivors'])
+    results['repeat_shared_survivors'] = len(full & set(results['full_repeat_survivors']))
+    results['shared_survivors'] = len(full & set(results['halving_survivors']))
+    return results
+
+
+def bench_reinforce(n_worlds=64, episode_ticks=1000, iterations=5):
+    '''Game steps/sec of ReinforceTrainer, rollouts plus the batched update.'''
+    trainer = ReinforceTrainer(ReinforceConfig(
+        n_worlds=n_worlds, episode_ticks=episode_ticks, iterations=iterations, checkpoint_path=None,
+    ))
+    start = time.perf_counter()
+    history = trainer.train()
+    return {'reinforce_steps_per_sec': sum(stats['steps'] for stats in history) / (time.perf_counter() - start)}
+
+
+def bench_learning_modes(n_players=10, round_limit=2000):
+    '''Steps/sec and mean final level of App rounds with online vs replay-buffer training.'''
+    results = {}
+    for mode in ('online', 'replay'):
+        conf = Config()
+        conf.round_limit = round_limit
+        conf.learning_mode = mode
+        players = [get_player(conf) for _ in range(n_players)]
+        apps = _sequential_apps(players, conf)
+        start = time.perf_counter()
+        for A in apps:
+            A.run()
+        results[mode] = {
+            'steps_per_sec': sum(A.round_count for A in apps) / (time.perf_counter() - start),
+            'final_level': float(np.mean([p.level for p in players])),
+        }
+    return results
+
+
+def bench_create_children(n_survivors=10, n_children=100):
+    '''Seconds to make ``n_survivors * n_children`` children: dense copies vs flat genomes vs sparse children.
+
+    Flat and sparse children build their networks on first use, timed
+    separately as ``*_materialize_sec``; that is where most of a dense
+    copy's time goes (module, initialization and optimizer per child).
+    The byte counts are the weights a child holds before its round: a full
+    parameter copy (optimizer and object overhead not counted) vs a sparse
+    mutation record.
+    '''
+    conf = Config()
+    survivors = [get_player(conf) for _ in range(n_survivors)]
+    results = {}
+
+    start = time.perf_counter()
+    create_children(survivors, conf, n_children)
+    results['dense_copy_sec'] = time.perf_counter() - start
+
+    population = GenomePopulation.from_networks([p.network for p in survivors])
+    start = time.perf_counter()
+    population.spawn(range(n_survivors), n_children)
+    results['genome_spawn_sec'] = time.perf_counter() - start
+
+    conf.flat_genomes = True
+    start = time.perf_counter()
+    children = create_children(survivors, conf, n_children)
+    results['flat_children_sec'] = time.perf_counter() - start
+    start = time.perf_counter()
+    for child in children:
+        child.network
+    results['flat_materialize_sec'] = time.perf_counter() - start
+
+    conf.flat_genomes = False
+    conf.sparse_children = True
+    start = time.perf_counter()
+    children = create_children(survivors, conf, n_children)
+    results['sparse_children_sec'] = time.perf_counter() - start
+    results['dense_bytes_per_child'] = float(np.mean([
+        sum(a.nbytes for a in p.network.parameter_arrays()) for p in survivors
+    ]))
+    results['sparse_bytes_per_child'] = float(np.mean([p.genome.nbytes for p in children]))
+    start = time.perf_counter()
+    for child in children:
+        child.network
+    results['sparse_materialize_sec'] = time.perf_counter() - start
+    return results
+
+
+def bench_app_ticks(entity_counts=((3, 2), (30, 20), (300, 200)), round_limit=500):
+    '''Headless App ticks/sec (networks training) for (particles, killers) counts.'''
+    results = {}
+    for n_particles, n_killers in entity_counts:
+        conf = Config()
+        conf.number_of_particles = n_particles
+        conf.number_of_killers = n_killers
+        conf.round_limit = round_limit
+        A = _sequential_apps([get_player(conf)], conf)[0]
+        start = time.perf_counter()
+        A.run()
+        results[f'app_ticks_per_sec[p{n_particles}_k{n_killers}]'] = A.round_count / (time.perf_counter() - start)
+    return results
+
+
+def bench_render(entity_counts=(500, 5000), frames=120):
+    '''Frames/sec of App._render_graphics with one tick between frames: full redraw vs dirty rectangles.
+
+    ``moving`` runs model.brownian_motion on every entity, the worst case
+    for dirty rectangles. Needs a display, or SDL_VIDEODRIVER=dummy.
+    '''
+    results = {}
+    for n, (scene, motion) in product(entity_counts, (('static', None), ('moving', brownian_motion))):
+        conf = Config()
+        conf.number_of_particles = n * 3 // 5
+        conf.number_of_killers = n - conf.number_of_particles
+        conf.entity_store = True
+        conf.npc_motion = motion
+        conf.render = True
+        conf.round_limit = frames + 1
+        for name, dirty_rects in (('full', False), ('dirty', True)):
+            conf.dirty_rects = dirty_rects
+            A = dashboard.make_app(get_player(conf), conf)
+            A.on_init()
+            elapsed = 0.0
+            for _ in range(frames):
+                A._tick()
+                start = time.perf_counter()
+                A._render_graphics()
+                elapsed += time.perf_counter() - start
+            A.on_cleanup()
+            results[f'render_{name}_fps[{scene}_n{n}]'] = frames / elapsed
+    return results
+
+
+class _InlineRenderer:
+    '''RenderThread stand-in that draws on the simulation thread.'''
+    def __init__(self, sink, every):
+        self.sink = sink
+        self.every = every
+
+    def submit(self, frame):
+        self.sink(frame)
+
+    def close(self):
+        pass
+
+
+def bench_frame_capture(n_particles=300, n_killers=200, round_limit=1000, every=5):
+    '''Headless App ticks/sec writing every ``every``-th frame as PNG: drawn inline, on a RenderThread or a RenderProcess.'''
+    conf = Config()
+    conf.number_of_particles = n_particles
+    conf.number_of_killers = n_killers
+    conf.round_limit = round_limit
+    conf.entity_store = True
+    results = {}
+    for name in ('none', 'inline', 'thread', 'process'):
+        with tempfile.TemporaryDirectory() as directory:
+            A = _sequential_apps([get_player(conf)], conf)[0]
+            sink = ImageSink(directory, conf.window_dim)
+            if name == 'inline':
+                A.renderer = _InlineRenderer(sink, every)
+            elif name == 'thread':
+                A.renderer = RenderThread(sink, drop_stale=False, every=every)
+            elif name == 'process':
+                A.renderer = RenderProcess(sink, drop_stale=False, every=every)
+            start = time.perf_counter()
+            A.run()
+            results[f'capture_{name}_ticks_per_sec'] = A.round_count / (time.perf_counter() - start)
+    return results
+
+
+# Bytes a steady-state tick may allocate (median peak over the tick), all of it freed again by the next one.
+# Measured with the default Config, the 99th percentile is within 60 bytes of the median:
+# - the observation (npc update and collision check): the eaten/hit sets _check_collisions returns, 520 bytes
+# - the whole tick, i.e. the network step: Python objects torch creates on every call for the autograd graph
+#   and the Adam step, 3781 bytes training and 1200 inference-only; tensors live in torch's allocator, untraced
+# The bounds leave under 100 bytes of slack, less than one more numpy array alive during the tick
+OBSERVATION_ALLOC_BOUND = 600
+TICK_ALLOC_BOUNDS = {'train': 3900, 'predict': 1300}
+
+
+def _median_peak(call, n_calls):
+    peaks = np.zeros(n_calls)
+    for i in range(n_calls):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        call()
+        peaks[i] = tracemalloc.get_traced_memory()[1] - current
+    return float(np.median(peaks))
+
+
+def check_tick_allocations(n_ticks=500, warmup=200):
+    '''Median bytes allocated within one headless App tick, training and inference-only.
+
+    Raises AssertionError when a steady-state tick allocates more than the
+    bounds above (anything tracemalloc sees: Python objects and numpy
+    buffers), once for the observation alone and once for the whole tick,
+    or when allocations made by the observation pipeline (view,
+    observation, torch_network or numpy buffers) outlive their tick.
+    '''
+    results = {}
+    own_code = [tracemalloc.Filter(True, f'*{name}.py') for name in ('view', 'observation', 'torch_network')]
+    for name, train in (('train', True), ('predict', False)):
+        conf = Config()
+        conf.round_limit = warmup + 2 * n_ticks + 1
+        player = get_player(conf)
+        particle_list, killer_list = get_npcs(conf)
+        A = App(player, particle_list, killer_list, conf.window_dim, conf.eta, round_limit=conf.round_limit,
+                render=False, train_network=train)
+        for _ in range(warmup):
+            A._tick()
+
+        tracemalloc.start()
+        observation = _median_peak(A._update_npc_positions, n_ticks)
+        before = tracemalloc.take_snapshot()
+        tick = _median_peak(A._tick, n_ticks)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        # A handful of blocks (the last action, a cached float) are always alive; a per-tick leak is not
+        retained = 0
+        for filters in (own_code, [tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)]):
+            diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'filename')
+            retained += sum(stat.count_diff for stat in diff)
+        assert retained <= 8, f"{name}: {retained} blocks kept alive over {n_ticks} ticks"
+        assert observation <= OBSERVATION_ALLOC_BOUND, (
+            f"{name}: the observation allocates {observation:.0f} bytes per tick, bound is {OBSERVATION_ALLOC_BOUND}"
+        )
+        assert tick <= TICK_ALLOC_BOUNDS[name], (
+            f"{name}: {tick:.0f} bytes allocated per tick, bound is {TICK_ALLOC_BOUNDS[name]}"
+        )
+        results[f'observation_alloc_bytes[{name}]'] = observation
+        results[f'tick_alloc_bytes[{name}]'] = tick
+    return results
+
+
+def bench_net_latency(layer_sizes=(2, 4, 8, 16, 32, 64), input_dim=12, n_calls=300):
+    '''Mean TorchSteeringNet.train_step and predict latency in microseconds per (hidden1, hidden2).'''
+    results = {}
+    x = np.random.randn(input_dim, 1).astype(np.float32)
+    y = np.random.randn(2, 1).astype(np.float32)
+    for h1, h2 in product(layer_sizes, repeat=2):
+        net = TorchSteeringNet(TorchNetConfig(input_dim=input_dim, hidden1=h1, hidden2=h2))
+        for name, call in (('train_step', lambda: net.train_step(x, y)), ('predict', lambda: net.predict(x))):
+            call()
+            start = time.perf_counter()
+            for _ in range(n_calls):
+                call()
+            results[f'{name}_us[{h1}x{h2}]'] = (time.perf_counter() - start) / n_calls * 1e6
+    return results
+
+
+def bench_compiled_train_step(layer_sizes=((32, 8), (64, 64)), input_dim=12, n_calls=300):
+    '''TorchSteeringNet.train_step latency in microseconds, eager vs compiled, plus the one-off compile seconds.'''
+    results = {}
+    x = np.random.randn(input_dim, 1).astype(np.float32)
+    y = np.random.randn(2, 1).astype(np.float32)
+    for h1, h2 in layer_sizes:
+        for name, compile_step in (('eager', False), ('compiled', True)):
+            net = TorchSteeringNet(TorchNetConfig(input_dim=input_dim, hidden1=h1, hidden2=h2, compile=compile_step))
+            start = time.perf_counter()
+            net.train_step(x, y)
+            if compile_step:
+                results[f'compile_sec[{h1}x{h2}]'] = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(n_calls):
+                net.train_step(x, y)
+            results[f'{name}_train_step_us[{h1}x{h2}]'] = (time.perf_counter() - start) / n_calls * 1e6
+    return results
+
+
+def bench_numpy_policy(layer_sizes=((32, 8), (64, 64)), input_dim=12, n_calls=2000, path='/tmp/benchmark_policy.npz'):
+    '''Per-step latency in microseconds: TorchSteeringNet.predict vs the exported NumpyPolicy.'''
+    results = {}
+    x = np.random.randn(input_dim, 1).astype(np.float32)
+    for h1, h2 in layer_sizes:
+        net = TorchSteeringNet(TorchNetConfig(input_dim=input_dim, hidden1=h1, hidden2=h2))
+        export_numpy_policy(net, path)
+        policy = NumpyPolicy.load(path)
+        for name, predict in (('torch_predict', net.predict), ('numpy_predict', policy.predict)):
+            predict(x)
+            start = time.perf_counter()
+            for _ in range(n_calls):
+                predict(x)
+            results[f'{name}_us[{h1}x{h2}]'] = (time.perf_counter() - start) / n_calls * 1e6
+    return results
+
+
+def bench_sgd(batch_sizes=(1, 64, 1024), sizes=(12, 32, 8, 2), n_calls=200):
+    '''network.Network.SGD samples/sec for one (n, batch) minibatch per call.'''
+    results = {}
+    network = Network(list(sizes))
+    for batch in batch_sizes:
+        x = np.random.randn(sizes[0], batch)
+        y = np.random.randn(sizes[-1], batch)
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            network.SGD((x, y), 1, batch, 0.1)
+        results[f'sgd_samples_per_sec[b{batch}]'] = batch * n_calls / (time.perf_counter() - start)
+    return results
+
+
+def bench_generation(n_players=20, round_limit=500, level_cutoff=21):
+    '''Wall time of one run_evolution generation: evaluate, select and create children.'''
+    conf = Config()
+    conf.round_limit = round_limit
+    layer_sizes = [2, 4, 8, 16, 32, 64]
+    players = []
+    for _ in range(n_players):
+        conf.first_layer = np.random.choice(layer_sizes)
+        conf.second_layer = np.random.choice(layer_sizes)
+        players.append(get_player(conf))
+    start = time.perf_counter()
+    survivors = run_simulation_batch(players, level_cutoff, conf)
+    if survivors:
+        create_children(survivors, conf, n_children=max(n_players // len(survivors) - 1, 1))
+    return {f'generation_sec[n{n_players}]': time.perf_counter() - start}
+
+
+def run_suite(quick=False):
+    '''Run every benchmark; ``quick`` shrinks the workloads for a fast smoke run.'''
+    scale = 5 if quick else 1
+    results = {}
+    results.update(bench_app_ticks(round_limit=500 // scale))
+    results.update(check_tick_allocations(n_ticks=500 // scale))
+    results.update(bench_net_latency(n_calls=300 // scale))
+    results.update(bench_numpy_policy(n_calls=2000 // scale))
+    results.update(bench_compiled_train_step(n_calls=300 // scale))
+    results.update(bench_sgd(n_calls=200 // scale))
+    results.update(bench_generation(n_players=20 // scale, round_limit=500))
+    return results
+
+
+def higher_is_better(metric):
+    return '_per_sec' in metric
+
+
+def compare(results, baseline, tolerance=0.15):
+    '''Ratios against the baseline plus the metrics that got worse by more than ``tolerance``.'''
+    ratios, regressions = {}, []
+    for metric, value in results.items():
+        if metric not in baseline:
+            continue
+        ratio = value / baseline[metric] if higher_is_better(metric) else baseline[metric] / value
+        ratios[metric] = ratio
+        if ratio < 1 - tolerance:
+            regressions.append(metric)
+    return ratios, regressions
+
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+
+def run_experiments():
+    '''Side-by-side comparisons of the optional engines and modes.'''
+    for name, result in (('world only', bench_world_only()), ('with networks', bench_lockstep())):
+        print(f"{name}: " + ", ".join(f"{key} {value:.0f}" for key, value in result.items()))
+
+    print(", ".join(f"{key} {value:.1f}" for key, value in bench_arena().items()))
+
+    for row in bench_spatial_grid():
+        print(f"{row['entities']} entities: linear {row['linear_ticks_per_sec']:.0f} ticks/s, "
+              f"grid {row['grid_ticks_per_sec']:.0f} ticks/s")
+
+    for row in bench_entity_store():
+        print(f"{row['entities']} entities: objects {row['objects_bytes_per_entity']:.0f} B/entity "
+              f"{row['objects_ticks_per_sec']:.0f} ticks/s, store {row['store_bytes_per_entity']:.0f} B/entity "
+              f"{row['store_ticks_per_sec']:.0f} ticks/s")
+
+    result = bench_successive_halving()
+    print(f"successive halving: {result['halving_ticks']} ticks vs {result['full_ticks']} full "
+          f"({result['halving_sec']:.0f}s vs {result['full_sec']:.0f}s), "
+          f"{len(result['halving_survivors'])} survivors vs {len(result['full_survivors'])}, "
+          f"{result['shared_survivors']} shared (two full runs share {result['repeat_shared_survivors']})")
+
+    print(", ".join(f"{key} {value:.0f}" for key, value in bench_reinforce().items()))
+
+    print(", ".join(f"{key} {value:.0f}" for key, value in bench_frame_capture().items()))
+
+    print(", ".join(f"{key} {value:.0f}" for key, value in bench_render().items()))
+
+    for mode, result in bench_learning_modes().items():
+        print(f"{mode}: {result['steps_per_sec']:.0f} steps/s, final level {result['final_level']:.1f}")
+
+    print(", ".join(f"{key} {value:.3f}" for key, value in bench_create_children().items()))
+
+    for name, s in compare_statistics().items():
+        print(f"{name}: final level {s['final_level'][0]:.1f} ± {s['final_level'][1]:.1f}, "
+              f"max level {s['max_level'][0]:.1f} ± {s['max_level'][1]:.1f}, "
+              f"survival {s['survival']:.2f}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark the simulation, networks and evolution loop.')
+    parser.add_argument('--quick', action='store_true', help='smaller workloads')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the results')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--experiments', action='store_true', help='run the engine/mode comparisons instead')
+    args = parser.parse_args()
+
+    if args.experiments:
+        run_experiments()
+        exit()
+
+    torch.set_num_threads(1)
+    results = run_suite(args.quick)
+    report = {'environment': _environment(), 'quick': args.quick, 'results': results}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=1)
+
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+    except FileNotFoundError:
+        baseline = {}
+    ratios, regressions = compare(results, baseline)
+    for metric, value in results.items():
+        ratio = f'  x{ratios[metric]:.2f} vs baseline' if metric in ratios else ''
+        print(f'{metric:40s} {value:14.1f}{ratio}')
+    if regressions:
+        print(f'{len(regressions)} regressions: ' + ', '.join(regressions))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=1)
@@ -0,0 +1,158 @@
+# checkpoint.py
+import glob
+import json
+import os
+import pickle
+import queue
+import random
+import threading
+from dataclasses import asdict
+
+import numpy as np
+import torch
+
+from network import Network
+from torch_network import TorchSteeringNet, TorchNetConfig
+
+
+def capture_rng_state():
+    return {
+        'random': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+
+
+def restore_rng_state(state):
+    random.setstate(state['random'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+
+
+def network_spec(network):
+    if isinstance(network, Network):
+        return {'kind': 'numpy', 'sizes': list(network.sizes), 'dtype': network.dtype.name}
+    return {'kind': 'torch', 'cfg': asdict(network.cfg)}
+
+
+def network_from_spec(spec):
+    '''A new, freshly initialized network with the architecture and config in ``network_spec`` output.'''
+    if spec['kind'] == 'numpy':
+        return Network(spec['sizes'], dtype=spec['dtype'])
+    return TorchSteeringNet(TorchNetConfig(**spec['cfg']))
+
+
+def build_network(spec, weights):
+    '''Rebuild a network from ``network_spec`` output and its flat parameter vector.'''
+    network = network_from_spec(spec)
+    offset = 0
+    arrays = []
+    for shape in network.parameter_shapes():
+        size = int(np.prod(shape))
+        arrays.append(weights[offset:offset + size].reshape(shape))
+        offset += size
+    if spec['kind'] == 'numpy':
+        network.bind_parameters([a.astype(network.dtype) for a in arrays])
+    else:
+        with torch.no_grad():
+            for param, arr in zip(network.model.parameters(), arrays):
+                param.copy_(torch.from_numpy(arr))
+    return network
+
+
+class CheckpointWriter:
+    '''Writes per-generation checkpoints from a background thread.
+
+    ``submit`` copies the population's weights and stats on the calling
+    thread (cheap, and safe against later training) and queues them; the
+    thread does the serializing and disk I/O. Each checkpoint is one .npz
+    with every player's weights in a single flat array, written to a temp
+    file and renamed so a crash never leaves a half-written checkpoint.
+
+    A failed write (disk full, say) removes its temp file and stops the
+    writing; the thread keeps draining the queue so nothing blocks, and the
+    error is re-raised by the next ``submit`` and by ``close``.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # First exception of the writer thread, no checkpoints are written after it
+        self.error = None
+        self._reported = False
+        self._queue = queue.Queue(maxsize=2)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _raise_error(self):
+        self._reported = True
+        raise self.error
+
+    def submit(self, generation, players):
+        if self.error is not None:
+            self._raise_error()
+        weights = [
+            np.concatenate([np.asarray(a, dtype=np.float64).ravel() for a in p.network.parameter_arrays()])
+            for p in players
+        ]
+        meta = {
+            'generation': generation,
+            'networks': [network_spec(p.network) for p in players],
+            'stats': [{'level': p.level, 'level_data': list(p.level_data)} for p in players],
+        }
+        self._queue.put((generation, weights, meta, capture_rng_state()))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            generation, weights, meta, rng_state = item
+            path = os.path.join(self.directory, f'checkpoint_{generation:04d}.npz')
+            tmp_path = path + '.tmp'
+            try:
+                with open(tmp_path, 'wb') as file:
+                    np.savez(
+                        file,
+                        weights=np.concatenate(weights),
+                        offsets=np.cumsum([0] + [len(w) for w in weights]),
+                        meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8),
+                        rng=np.frombuffer(pickle.dumps(rng_state), dtype=np.uint8),
+                    )
+                os.replace(tmp_path, path)
+            except Exception as e:
+                self.error = e
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def close(self):
+        '''Wait for queued checkpoints to be written, re-raising a write error not raised by ``submit`` yet.'''
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None and not self._reported:
+            self._raise_error()
+
+
+def clear_checkpoints(directory):
+    '''Delete the checkpoints in ``directory`` so a new run can't be resumed from an older one's.'''
+    paths = glob.glob(os.path.join(directory, 'checkpoint_*.npz'))
+    for path in paths:
+        os.remove(path)
+    return len(paths)
+
+
+def load_latest_checkpoint(directory):
+    '''Return ``{'generation', 'networks', 'stats', 'rng_state'}`` for the newest checkpoint, or None.'''
+    paths = sorted(glob.glob(os.path.join(directory, 'checkpoint_*.npz')))
+    if not paths:
+        return None
+    with np.load(paths[-1]) as data:
+        weights, offsets = data['weights'], data['offsets']
+        meta = json.loads(data['meta'].tobytes())
+        rng_state = pickle.loads(data['rng'].tobytes())
+    networks = [
+        build_network(spec, weights[start:end])
+        for spec, start, end in zip(meta['networks'], offsets[:-1], offsets[1:])
+    ]
+    return {'generation': meta['generation'], 'networks': networks, 'stats': meta['stats'], 'rng_state': rng_state}
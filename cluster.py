@@ -0,0 +1,140 @@
+# cluster.py
+import argparse
+import itertools
+import queue
+import threading
+import time
+import traceback
+from multiprocessing.connection import Listener, Client
+
+
+class Coordinator:
+    '''Hands jobs to workers that connect over TCP and streams their results back.
+
+    Workers (``run_worker``) can connect or drop out at any time, also in the
+    middle of a ``map_unordered`` call. Each worker has one job at a time; a
+    job whose worker disconnects, or doesn't answer within ``job_timeout``
+    seconds, goes back in the queue for the next free worker (counted in
+    ``retries``). Connections use multiprocessing.connection's HMAC handshake
+    with ``authkey``, and jobs and results are pickles: whoever knows the key
+    can run code on the coordinator, so use a secret one and keep the
+    address on a network you trust.
+    '''
+    def __init__(self, authkey, address=('127.0.0.1', 0), job_timeout=None):
+        if not authkey:
+            raise ValueError("Coordinator needs a secret authkey")
+        self.job_timeout = job_timeout
+        self.workers = 0
+        self.retries = 0
+        self._listener = Listener(tuple(address), authkey=authkey)
+        # The bound address, with the port filled in when 0 was asked for
+        self.address = self._listener.address
+        self._pending = queue.Queue()
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._batches = itertools.count()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                # Closed listener, or a client that failed the handshake
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with self._lock:
+            self.workers += 1
+        try:
+            while not self._closed.is_set():
+                try:
+                    job_id, job = self._pending.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                try:
+                    conn.send(job)
+                    if not conn.poll(self.job_timeout):
+                        raise TimeoutError
+                    reply = conn.recv()
+                except (OSError, EOFError, TimeoutError):
+                    with self._lock:
+                        self.retries += 1
+                    self._pending.put((job_id, job))
+                    return
+                self._results.put((job_id, reply))
+        finally:
+            conn.close()
+            with self._lock:
+                self.workers -= 1
+
+    def map_unordered(self, jobs):
+        '''Yield ``(index, result)`` for every job as the results come in.'''
+        batch = next(self._batches)
+        jobs = list(jobs)
+        for i, job in enumerate(jobs):
+            self._pending.put(((batch, i), job))
+        remaining = len(jobs)
+        while remaining:
+            (job_batch, i), (ok, result) = self._results.get()
+            if job_batch != batch:
+                # Left over from a call that stopped early
+                continue
+            remaining -= 1
+            if not ok:
+                raise RuntimeError(f'job {i} failed on a worker:\n{result}')
+            yield i, result
+
+    def close(self):
+        '''Stop accepting workers and disconnect the idle ones.'''
+        self._closed.set()
+        self._listener.close()
+
+
+def run_worker(address, function, authkey, connect_timeout=30.0):
+    '''Evaluate ``function(job)`` for the jobs a Coordinator sends until it goes away.
+
+    Keeps trying to connect for ``connect_timeout`` seconds, so workers may
+    be started before the coordinator. Returns the number of jobs done.
+    '''
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            conn = Client(tuple(address), authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+    done = 0
+    with conn:
+        while True:
+            try:
+                job = conn.recv()
+            except (OSError, EOFError):
+                return done
+            try:
+                reply = (True, function(job))
+            except Exception:
+                reply = (False, traceback.format_exc())
+            try:
+                conn.send(reply)
+            except OSError:
+                return done
+            done += 1
+
+
+if __name__ == "__main__":
+    # Evaluate run_evolution rounds for a coordinator: python cluster.py host:port --authkey <Config.cluster_authkey>
+    from dashboard import _init_worker, _run_packed_round
+
+    parser = argparse.ArgumentParser(description='Evaluation worker for a dashboard coordinator.')
+    parser.add_argument('address', help='host:port of the coordinator (Config.coordinator_address)')
+    parser.add_argument('--authkey', required=True, help='the secret in Config.cluster_authkey')
+    args = parser.parse_args()
+
+    host, port = args.address.rsplit(':', 1)
+    _init_worker()
+    print(f'{run_worker((host, int(port)), _run_packed_round, args.authkey.encode())} jobs done')
@@ -1,11 +1,29 @@
 # dashboard.py
+import math
 import os
+import random
 
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from random import choice
 
+import numpy as np
+import torch
+
 from view import App
-from model import Player, Particle, Killer
+from batch_engine import BatchWorld, Arena
+from recording import EpisodeRecorder
+from render import RenderThread, ImageSink
+from profiling import PhaseProfiler, ProfileLog
+from fitness_cache import FitnessCache
+from cluster import Coordinator
+from checkpoint import (
+    CheckpointWriter, build_network, clear_checkpoints, load_latest_checkpoint, network_spec, restore_rng_state,
+)
+from model import Player, Particle, Killer, EntityStore
 from network import Network
+from observation import knearest_input_dim
+from genome import GenomePopulation, GenomeRow, SparseChild
 from torch_network import TorchSteeringNet, TorchNetConfig
 
 
@@ -25,18 +43,92 @@ class Config:
     second_layer = 8
     # PyTorch LR
     lr = 1e-3
-    # If the game is runnung too fast/slow on your machine you can lower/higher this value to tune the time.sleep() parameter.
-    time_sleep = 0.015
+    # "online" trains on every tick, "replay" trains on a replay minibatch every `update_every` ticks
+    learning_mode = "online"
+    buffer_size = 4096
+    batch_size = 64
+    update_every = 16
+    # Compile the torch train step (torch.compile, falling back to TorchScript); the first step per net shape is slow
+    compile_network = False
+    # Simulation ticks per second while rendering, so a round plays at the same speed on any machine.
+    # None runs as fast as possible (network play only); headless rounds ignore it and never wait
+    tick_rate = 60
+    # Frame rate cap while rendering, frames are skipped when the simulation runs faster
+    max_fps = 60
     # Set a limit for the number of rounds the game will run.
     round_limit = 12000
     # Choose whether to render the game or not
     render = False
+    # Redraw only the entities that moved or changed since the last frame, from cached sprites
+    dirty_rects = False
+    # Headless rounds write every `capture_every`-th frame as PNG here, drawn offscreen on a background thread
+    # (frames are named by tick, so this is meant for single rounds such as a champion run)
+    capture_dir = None
+    capture_every = 1
     old_network = False  # If True, use old Network class; if False, use TorchSteeringNet
+    # Evaluate a whole batch of players in lockstep with BatchWorld instead of one App per player
+    lockstep = False
+    # With lockstep or arena, train all torch networks of the batch together in batched tensors
+    # (online learning_mode without compile_network only)
+    batched_networks = False
+    # Evaluate a whole batch in one shared world (batch_engine.Arena): the players compete for the same
+    # particles and killers, observed and collided for everyone in one pass per tick
+    arena = False
+    # Index particles and killers in a spatial grid so collision checks only look at nearby cells
+    spatial_grid = False
+    # Keep particles and killers in model.EntityStore arrays and process them as whole arrays
+    entity_store = False
+    # Vectorized motion applied to every EntityStore entity each tick, e.g. model.brownian_motion (None is static)
+    npc_motion = None
+    # Feed the network only the k nearest particles and killers (None uses every entity)
+    k_nearest = None
+    # Create children as rows of one flat float32 parameter array per architecture, each bound to a
+    # network on first use (genome.GenomeRow)
+    flat_genomes = False
+    # Keep children as their parent's weights plus a sparse mutation record (genome.SparseChild) and build
+    # each child's network only when it is first used, i.e. when its round starts (ignored with flat_genomes)
+    sparse_children = False
+    # Record every tick of a round to this file (replay with `python recording.py <file>`)
+    record_path = None
+    # Time the phases of every App round and write per-round/per-generation profiles in run_evolution
+    profile = False
+    # Write a checkpoint of every evaluated generation here, e.g. 'networks/checkpoints' (None disables
+    # checkpoints); a run that doesn't resume deletes the checkpoints of earlier runs first
+    checkpoint_dir = None
+    # Continue run_evolution from the latest checkpoint in checkpoint_dir
+    resume = False
+    # False plays inference-only (no training during the round)
+    train_network = True
+    # Number of worker processes used to evaluate a batch (1 runs everything in this process)
+    workers = 1
+    # Base seed for the per-player seeds handed to workers
+    seed = 0
+    # Serve run_evolution's rounds to `python cluster.py <host>:<port> --authkey <key>` workers from this
+    # (host, port), e.g. ('127.0.0.1', 5555); workers can join or leave at any time and jobs of lost workers
+    # are played again. Results are unpickled, so anyone with the key can run code here: set cluster_authkey
+    # to a secret (bytes) and only bind beyond loopback on a network you trust
+    coordinator_address = None
+    cluster_authkey = None
+    # Seconds a cluster worker gets for one round before its job goes to another worker (None waits forever)
+    job_timeout = None
+    # Evaluate batches by successive halving: everyone plays a short horizon, the best `halving_keep`
+    # fraction plays on to a 1/halving_keep times longer one, and so on for `halving_rungs` up to round_limit.
+    # At most ~halving_keep**(halving_rungs - 1) of a batch finishes, which also caps how many can survive
+    successive_halving = False
+    halving_rungs = 3
+    halving_keep = 1 / 3
+    # Give every round its own RNG streams seeded from `seed`: "fixed" plays every round in the same world,
+    # "generation" uses one world per generation, None draws from the global random state as before
+    seeded_rounds = None
+    # With seeded_rounds, play identical players of a generation (unmutated siblings) once (not with successive halving)
+    fitness_cache = True
 
 
 def get_player(conf):
     n_cells = 1 + conf.number_of_particles + conf.number_of_killers
     input_dim = 2 * n_cells  # matches coord_array length
+    if conf.k_nearest is not None:
+        input_dim = knearest_input_dim(conf.k_nearest)
 
     if conf.old_network:
         network = Network([input_dim, conf.first_layer, conf.second_layer, 2])  # old
@@ -47,6 +139,11 @@ def get_player(conf):
             hidden1=conf.first_layer,
             hidden2=conf.second_layer,
             lr=conf.lr,
+            learning_mode=conf.learning_mode,
+            buffer_size=conf.buffer_size,
+            batch_size=conf.batch_size,
+            update_every=conf.update_every,
+            compile=conf.compile_network,
         )
         network = TorchSteeringNet(net_cfg)
 
@@ -54,14 +151,19 @@ def get_player(conf):
     return player
 
 
-def get_npcs(conf):
+def get_npcs(conf, rng=None):
+    if conf.entity_store:
+        return (
+            EntityStore.particles(conf.number_of_particles, conf.window_dim, conf.npc_motion, rng),
+            EntityStore.killers(conf.number_of_killers, conf.window_dim, conf.npc_motion, rng),
+        )
     particle_list = []
     killer_list = []
     for i in range(0, conf.number_of_particles):
-        new_particle = Particle(f'particle_{i}', conf.window_dim)
+        new_particle = Particle(f'particle_{i}', conf.window_dim, rng)
         particle_list.append(new_particle)
     for i in range(0, conf.number_of_killers):
-        new_killer = Killer(f'killer_{i}', conf.window_dim)
+        new_killer = Killer(f'killer_{i}', conf.window_dim, rng)
         killer_list.append(new_killer)
     return particle_list, killer_list
 
@@ -96,38 +198,405 @@ def write_data(player):
     return
 
 
-def run_simulation_round(player, conf):
-    particle_list, killer_list = get_npcs(conf)
-    A = App(
+def write_profile(profile_log):
+    write_path = 'networks/'
+    os.makedirs(write_path, exist_ok=True)
+    profile_log.write_json(write_path + 'profile.json')
+    profile_log.write_csv(write_path + 'profile.csv')
+
+
+def make_renderer(conf):
+    if conf.capture_dir and not conf.render:
+        return RenderThread(ImageSink(conf.capture_dir, conf.window_dim), drop_stale=False, every=conf.capture_every)
+    return None
+
+
+def make_app(player, conf, rng=None):
+    particle_list, killer_list = get_npcs(conf, rng)
+    return App(
         player,
         particle_list,
         killer_list,
         conf.window_dim,
         conf.eta,
-        conf.time_sleep,
+        tick_rate=conf.tick_rate,
+        round_limit=conf.round_limit,
+        render=conf.render,
+        old_network=conf.old_network,
+        spatial_grid=conf.spatial_grid,
+        k_nearest=conf.k_nearest,
+        max_fps=conf.max_fps,
+        recorder=EpisodeRecorder(conf.record_path) if conf.record_path else None,
+        profiler=PhaseProfiler() if conf.profile else None,
+        train_network=conf.train_network,
+        rng=rng,
+        renderer=make_renderer(conf),
+        dirty_rects=conf.dirty_rects,
+    )
+
+
+def round_seed(conf, generation=0):
+    '''Seed of the rounds of ``generation`` under conf.seeded_rounds, None when rounds are not seeded.'''
+    if conf.seeded_rounds is None:
+        return None
+    if conf.seeded_rounds == 'fixed':
+        generation = 0
+    elif conf.seeded_rounds != 'generation':
+        raise ValueError(f"Unknown seeded_rounds: {conf.seeded_rounds}")
+    return int(np.random.SeedSequence([conf.seed, generation]).generate_state(1)[0])
+
+
+def seeded_rng(seed):
+    '''The round's own random.Random, None for unseeded rounds.'''
+    if seed is None:
+        return None
+    return random.Random(seed)
+
+
+def seed_replay_sampling(network, seed):
+    # Replay minibatches of a seeded round come from the network's own generator: reseeding torch's
+    # global one would hand every generation the same mutation noise
+    if isinstance(network, TorchSteeringNet):
+        network.seed_sampling(seed)
+
+
+def run_simulation_round(player, conf, seed=None):
+    A = make_app(player, conf, seeded_rng(seed))
+    seed_replay_sampling(player.network, seed)
+    try:
+        A.run()
+    finally:
+        seed_replay_sampling(player.network, None)
+    if A.profiler is not None:
+        return A.profiler.summary()
+
+
+def halving_horizons(round_limit, rungs, keep):
+    '''Round lengths of the successive-halving rungs, each 1/keep times the previous, ending at round_limit.'''
+    return [max(1, int(round_limit * keep ** (rungs - 1 - rung))) for rung in range(rungs)]
+
+
+def halving_rank(player, level_cutoff):
+    '''Sort key for the halving rungs: players that already reached level_cutoff only have to stay alive.'''
+    max_level = max(player.level_data, default=0)
+    return max_level >= level_cutoff, player.level + max_level
+
+
+def run_simulation_halving(players, level_cutoff, conf, seed=None):
+    '''
+    Successive halving: every player plays the first, shortest horizon, the best
+    conf.halving_keep fraction plays on from where it stopped to the next one, and
+    so on up to round_limit. Dead players stop at every rung. Returns the players
+    that played the whole round and the round profiles. With a ``seed`` every
+    player gets the same world.
+
+    At most about n * halving_keep**(halving_rungs - 1) of n players finish, so
+    no more can survive however many would in full rounds: this caps the
+    survivors, it doesn't just find them sooner. The rungs rank players that
+    already reached level_cutoff first, so those are the last to be cut.
+    '''
+    apps = {}
+    active = list(players)
+    ticks = 0
+    profiles = []
+    for horizon in halving_horizons(conf.round_limit, conf.halving_rungs, conf.halving_keep):
+        for player in active:
+            if id(player) not in apps:
+                # Made when the player first plays, so a lazy genome only becomes a network here
+                apps[id(player)] = make_app(player, conf, seeded_rng(seed))
+                seed_replay_sampling(player.network, seed)
+            apps[id(player)].run_until(horizon)
+        n_keep = math.ceil(len(active) * conf.halving_keep)
+        kept = [player for player in active if player.level > 0]
+        if horizon < conf.round_limit:
+            kept.sort(key=lambda player: halving_rank(player, level_cutoff), reverse=True)
+            kept = kept[:n_keep]
+        kept_ids = {id(player) for player in kept}
+        for player in active:
+            if id(player) in kept_ids and horizon < conf.round_limit:
+                continue
+            # Done playing: keep the tick count and profile, let the App go with the network of a player that was cut
+            A = apps.pop(id(player))
+            ticks += A.round_count
+            if A.profiler is not None:
+                profiles.append(A.profiler.summary())
+            if id(player) in kept_ids:
+                seed_replay_sampling(player.network, None)
+            else:
+                player.network = None
+        active = kept
+    print(f'Successive halving: {ticks} ticks played, {len(players) * conf.round_limit} for full rounds')
+    return active, profiles
+
+
+def run_simulation_lockstep(players, conf):
+    world = (Arena if conf.arena else BatchWorld)(
+        players,
+        conf.number_of_particles,
+        conf.number_of_killers,
+        conf.window_dim,
+        conf.eta,
         conf.round_limit,
-        conf.render,
         conf.old_network,
+        conf.batched_networks,
+        conf.k_nearest,
     )
-    A.run()
+    world.run()
+
+
+def pack_network(network):
+    '''Weights, training state and the config needed to rebuild ``network`` in another process.
+
+    For a TorchSteeringNet the training state is the Adam state, the step
+    count and the replay buffer, so a round played elsewhere leaves the
+    network exactly as the same round played here would.
+    '''
+    if isinstance(network, Network):
+        return 'numpy', network.sizes, (network.weights, network.biases)
+    opt_state = network.opt.state_dict()
+    buffer = network.buffer
+    state = {
+        'model': {k: v.detach().cpu().numpy() for k, v in network.model.state_dict().items()},
+        'opt': {
+            'state': {
+                i: {k: v.detach().cpu().numpy() for k, v in param_state.items()}
+                for i, param_state in opt_state['state'].items()
+            },
+            'param_groups': opt_state['param_groups'],
+        },
+        'steps': network.steps,
+        'buffer': None if buffer is None else (
+            buffer.x.cpu().numpy(), buffer.y.cpu().numpy(), buffer.pos, buffer.count,
+        ),
+    }
+    return 'torch', network.cfg, state
+
+
+def pack_player(player):
+    '''pack_network of the player's network, or of a lazy genome's weights without building the network.'''
+    if player.genome is None:
+        return pack_network(player.network)
+    return 'genome', player.genome.spec, player.genome.weights()
+
+
+def load_packed_weights(network, packed):
+    _, _, weights = packed
+    if isinstance(network, Network):
+        network.weights, network.biases = weights
+        return
+    network.model.load_state_dict({k: torch.from_numpy(v) for k, v in weights['model'].items()})
+    network.opt.load_state_dict({
+        'state': {
+            # Copies, Adam would keep tensors sharing memory with ``packed``
+            i: {k: torch.tensor(v) for k, v in param_state.items()}
+            for i, param_state in weights['opt']['state'].items()
+        },
+        'param_groups': weights['opt']['param_groups'],
+    })
+    network.steps = weights['steps']
+    if weights['buffer'] is not None:
+        x, y, network.buffer.pos, network.buffer.count = weights['buffer']
+        network.buffer.x.copy_(torch.from_numpy(x))
+        network.buffer.y.copy_(torch.from_numpy(y))
+
+
+def unpack_network(packed):
+    kind, spec, weights = packed
+    if kind == 'genome':
+        return build_network(spec, weights)
+    network = Network(spec) if kind == 'numpy' else TorchSteeringNet(spec)
+    load_packed_weights(network, packed)
+    return network
+
+
+def _init_worker():
+    # One intra-op thread per worker, the pool provides the parallelism
+    torch.set_num_threads(1)
+
+
+def _run_packed_round(job):
+    '''Worker side of run_simulation_parallel: rebuild the player, play a round, send results back.'''
+    packed, conf_items, seed, seed_of_round = job
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
 
+    conf = Config()
+    for key, value in conf_items.items():
+        setattr(conf, key, value)
+    player = Player(conf.window_dim, unpack_network(packed), conf.use_network)
+    profile = run_simulation_round(player, conf, seed_of_round)
 
-def run_simulation_batch(players, level_cutoff=25):
+    state = {key: getattr(player, key) for key in ('x', 'y', 'level', 'size', 'fill', 'R', 'G', 'B', 'level_data')}
+    return state, pack_network(player.network), profile
+
+
+def _round_jobs(players, conf, generation):
+    conf_items = {key: getattr(conf, key) for key in dir(Config) if not key.startswith('_')}
+    seeds = np.random.SeedSequence([conf.seed, generation]).generate_state(len(players))
+    seed_of_round = round_seed(conf, generation)
+    return [(pack_player(p), conf_items, int(s), seed_of_round) for p, s in zip(players, seeds)]
+
+
+def _apply_round_result(player, result, level_cutoff):
+    state, packed, profile = result
+    for key, value in state.items():
+        setattr(player, key, value)
+    if survives(player, level_cutoff):
+        load_packed_weights(player.network, packed)
+    else:
+        # Only survivors have children, a lazy genome that lost is never built here
+        player.network = None
+    return profile
+
+
+def run_simulation_parallel(players, conf, level_cutoff, generation=0):
+    '''Evaluate ``players`` in a pool of ``conf.workers`` processes.
+
+    Each player gets its own seed derived from ``conf.seed`` and ``generation``,
+    so results do not depend on which worker picks up which player; seeded
+    rounds play the world of ``round_seed`` instead. The round stats are
+    copied back onto the ``Player`` objects, and the trained network onto
+    those that survive; the others lose their network.
+    Returns the round profiles (None for each round unless ``conf.profile``).
+    '''
+    jobs = _round_jobs(players, conf, generation)
+    with ProcessPoolExecutor(conf.workers, mp_context=get_context('spawn'), initializer=_init_worker) as pool:
+        return [
+            _apply_round_result(p, result, level_cutoff)
+            for p, result in zip(players, pool.map(_run_packed_round, jobs))
+        ]
+
+
+def run_simulation_distributed(players, conf, coordinator, level_cutoff, generation=0):
+    '''Evaluate ``players`` on the workers of a cluster.Coordinator.
+
+    Same jobs, seeds and results as run_simulation_parallel, so the outcome
+    doesn't depend on which worker plays which round; results are copied
+    onto the players as they come in.
+    '''
+    jobs = _round_jobs(players, conf, generation)
+    profiles = [None] * len(players)
+    for done, (i, result) in enumerate(coordinator.map_unordered(jobs), 1):
+        profiles[i] = _apply_round_result(players[i], result, level_cutoff)
+        if done % 20 == 0 or done == len(jobs):
+            print(f'{done} of {len(jobs)} rounds back from {coordinator.workers} workers')
+    return profiles
+
+
+def run_simulation_batch(players, level_cutoff, conf, generation=0, profile_log=None, fitness_cache=None,
+                         coordinator=None):
     if conf.render is True:
         raise ValueError("If render is True, only run a single simulation.")
-    survivors = []
+    if conf.successive_halving and (conf.lockstep or conf.arena or conf.workers > 1 or coordinator is not None):
+        raise ValueError("successive_halving plays App rounds in this process, without lockstep, arena or workers")
+    if conf.successive_halving and (conf.record_path or conf.capture_dir):
+        raise ValueError("successive_halving plays rounds in segments, it can't record or capture them")
+    if (conf.batched_networks and (conf.lockstep or conf.arena) and not conf.old_network
+            and (conf.learning_mode != "online" or conf.compile_network)):
+        raise ValueError("batched_networks trains online in eager mode, without replay or compile_network")
+    if conf.seeded_rounds is not None and (conf.lockstep or conf.arena):
+        raise ValueError("seeded_rounds needs App rounds, BatchWorld draws from the global random state")
     print(f'Running batch of {len(players)} players')
-    for player in players:
-        run_simulation_round(player, conf)
-        max_level = max(player.level_data) if player.level_data else 0
-        final_level = player.level
-        # Only save successful networks
-        if max_level >= level_cutoff and final_level >= 1:
-            survivors.append(player)
+    seed = round_seed(conf, generation)
+    # Rounds already played with the same player, network and seed are taken from the cache
+    use_cache = fitness_cache is not None and seed is not None and not conf.successive_halving
+    pending, repeats = players, []
+    if use_cache:
+        keys = {id(p): fitness_cache.key(p, seed) for p in players}
+        pending, queued = [], set()
+        for player in players:
+            key = keys[id(player)]
+            if key in queued:
+                repeats.append(player)
+            elif not fitness_cache.restore(player, key):
+                queued.add(key)
+                pending.append(player)
+        print(f'Fitness cache: playing {len(pending)} of {len(players)} rounds, the rest were played before')
+    profiles = []
+    batch = players
+    if conf.successive_halving:
+        players, profiles = run_simulation_halving(players, level_cutoff, conf, seed)
+    elif conf.lockstep or conf.arena:
+        run_simulation_lockstep(pending, conf)
+    elif coordinator is not None:
+        profiles = run_simulation_distributed(pending, conf, coordinator, level_cutoff, generation)
+    elif conf.workers > 1:
+        profiles = run_simulation_parallel(pending, conf, level_cutoff, generation)
+    else:
+        for player in pending:
+            profiles.append(run_simulation_round(player, conf, seed))
+            if not survives(player, level_cutoff):
+                # Only survivors have children, so at most one losing network is alive at a time
+                player.network = None
+    if use_cache:
+        for player in pending:
+            # A repeat only needs the trained network when it survives, i.e. when this player did
+            keep_network = conf.train_network and survives(player, level_cutoff)
+            fitness_cache.add(keys[id(player)], player, keep_network=keep_network)
+        # Identical players within this batch get the outcome of the one that played
+        for player in repeats:
+            fitness_cache.restore(player, keys[id(player)])
+    if profile_log is not None:
+        for profile in profiles:
+            if profile is not None:
+                profile_log.add_round(generation, profile)
+    survivors = select_survivors(players, level_cutoff)
+    kept = {id(player) for player in survivors}
+    for player in batch:
+        if id(player) not in kept:
+            player.network = None
     return survivors
 
 
+def survives(player, level_cutoff):
+    max_level = max(player.level_data) if player.level_data else 0
+    final_level = player.level
+    # Only save successful networks
+    return max_level >= level_cutoff and final_level >= 1
+
+
+def select_survivors(players, level_cutoff):
+    return [player for player in players if survives(player, level_cutoff)]
+
+
+def create_children_flat(survivors, conf, n_children=5):
+    # One GenomePopulation per architecture, children are mutated rows bound to networks by Player.network
+    by_shape = {}
+    for parent in survivors:
+        by_shape.setdefault(tuple(parent.network.parameter_shapes()), []).append(parent)
+    children = []
+    for parents in by_shape.values():
+        population = GenomePopulation.from_networks([p.network for p in parents])
+        offspring = population.spawn(range(len(parents)), n_children, mutation_rate=0.1)
+        for i, parent in enumerate(parents):
+            spec = network_spec(parent.network)
+            for j in range(i * n_children, (i + 1) * n_children):
+                genome = GenomeRow(spec, offspring, j)
+                children.append(Player(conf.window_dim, None, conf.use_network, genome=genome))
+    print(f'Created {len(children)} children from {len(survivors)} survivors')
+    return children
+
+
+def create_children_sparse(survivors, conf, n_children=5):
+    # Networks are built lazily by Player.network, the survivors' networks can go once this returns.
+    # Each child carries its lineage, the (parent id, indices, deltas) records from the first generation on
+    children = [
+        Player(conf.window_dim, None, conf.use_network, genome=genome)
+        for parent in survivors
+        for genome in SparseChild.spawn(
+            parent.network, n_children, mutation_rate=0.1, parent_id=parent.id, lineage=parent.lineage,
+        )
+    ]
+    print(f'Created {len(children)} sparse children from {len(survivors)} survivors')
+    return children
+
+
 def create_children(survivors, conf, n_children=5):
+    if conf.flat_genomes:
+        return create_children_flat(survivors, conf, n_children)
+    if conf.sparse_children:
+        return create_children_sparse(survivors, conf, n_children)
     children = []
     for parent in survivors:
         for _ in range(n_children):
@@ -139,26 +608,82 @@ def create_children(survivors, conf, n_children=5):
     return children
 
 
-def run_evolution(n_players, n_batches, level_cutoff, conf):
-    layer_sizes = [2, 4, 8, 16, 32, 64]
+def next_generation(survivors, i, n_players, n_batches, conf):
+    if not survivors:
+        print(f'No survivors found in batch {i+1}, stopping.')
+        exit()
+    if i < n_batches - 1:
+        n_children = max(n_players // len(survivors) - 1, 1) # at most n_players total
+        return create_children(survivors, conf, n_children=n_children)
+    return survivors
+
+
+def resume_players(checkpoint, conf):
     players = []
-    for _ in range(n_players):
-        conf.first_layer = choice(layer_sizes)
-        conf.second_layer = choice(layer_sizes)
-        player = get_player(conf)
+    for network, stats in zip(checkpoint['networks'], checkpoint['stats']):
+        player = Player(conf.window_dim, network, conf.use_network)
+        player.level = stats['level']
+        player.level_data = stats['level_data']
         players.append(player)
-    for i, batch in enumerate(range(n_batches)):
-        print(f'Starting batch {batch+1} of {n_batches} with {len(players)} players')
-        survivors = run_simulation_batch(players, level_cutoff)
-        if not survivors:
-            print(f'No survivors found in batch {batch+1}, stopping.')
-            exit()
-        if i < n_batches - 1:
-            n_children = max(n_players // len(survivors) - 1, 1) # at most n_players total
-            children = create_children(survivors, conf, n_children=n_children)
-            players = children
-        else:
-            players = survivors
+    return players
+
+
+def run_evolution(n_players, n_batches, level_cutoff, conf):
+    checkpoint = load_latest_checkpoint(conf.checkpoint_dir) if conf.resume and conf.checkpoint_dir else None
+    if checkpoint is None:
+        if conf.checkpoint_dir and os.path.isdir(conf.checkpoint_dir):
+            n_old = clear_checkpoints(conf.checkpoint_dir)
+            if n_old:
+                print(f'Deleted {n_old} checkpoints of an earlier run from {conf.checkpoint_dir}')
+        layer_sizes = [2, 4, 8, 16, 32, 64]
+        players = []
+        for _ in range(n_players):
+            conf.first_layer = choice(layer_sizes)
+            conf.second_layer = choice(layer_sizes)
+            player = get_player(conf)
+            players.append(player)
+        first_batch = 0
+    else:
+        # Redo the selection of the checkpointed generation with the RNG state it was saved with
+        done = checkpoint['generation']
+        print(f'Resuming after batch {done+1} of {n_batches}')
+        restore_rng_state(checkpoint['rng_state'])
+        survivors = select_survivors(resume_players(checkpoint, conf), level_cutoff)
+        players = next_generation(survivors, done, n_players, n_batches, conf)
+        first_batch = done + 1
+    profile_log = ProfileLog() if conf.profile else None
+    fitness_cache = FitnessCache() if conf.fitness_cache and conf.seeded_rounds is not None else None
+    writer = CheckpointWriter(conf.checkpoint_dir) if conf.checkpoint_dir else None
+    coordinator = None
+    if conf.coordinator_address is not None:
+        if not conf.cluster_authkey:
+            raise ValueError("coordinator_address needs a secret cluster_authkey")
+        coordinator = Coordinator(conf.cluster_authkey, conf.coordinator_address, conf.job_timeout)
+        print(f'Waiting for workers: python cluster.py {coordinator.address[0]}:{coordinator.address[1]} --authkey ...')
+    try:
+        for i in range(first_batch, n_batches):
+            print(f'Starting batch {i+1} of {n_batches} with {len(players)} players')
+            survivors = run_simulation_batch(
+                players, level_cutoff, conf, generation=i, profile_log=profile_log, fitness_cache=fitness_cache,
+                coordinator=coordinator,
+            )
+            if profile_log is not None:
+                write_profile(profile_log)
+            if fitness_cache is not None:
+                # Its keys hold this generation's player states, no later round can hit them
+                fitness_cache.clear()
+            if writer is not None:
+                # Only survivors still have networks, and resuming selects nothing else
+                writer.submit(i, survivors)
+            players = next_generation(survivors, i, n_players, n_batches, conf)
+            # The children have their own copies of what they need, don't hold the parents through the next batch
+            survivors = None
+    finally:
+        # Also runs on exit() so queued checkpoints still reach the disk
+        if writer is not None:
+            writer.close()
+        if coordinator is not None:
+            coordinator.close()
     ranked_networks = sorted(players, key=lambda x: (x.level + max(x.level_data)), reverse=True)
     return ranked_networks
 
@@ -181,6 +706,8 @@ if __name__ == "__main__":
     test_conf = Config()
     test_conf.render = True
     test_conf.round_limit = 5000
+    test_conf.record_path = 'networks/champion_episode.bin'
+    os.makedirs('networks', exist_ok=True)
     player = ranked_networks[0]
     run_simulation_round(player, test_conf)
 
@@ -0,0 +1,139 @@
+# fitness_cache.py
+import copy
+import hashlib
+import json
+
+import numpy as np
+import torch
+
+from torch_network import TorchSteeringNet
+
+# Player attributes a round starts from and ends with
+PLAYER_STATE = ('x', 'y', 'level', 'size', 'fill', 'R', 'G', 'B', 'level_data')
+
+
+def network_fingerprint(network):
+    '''Digest of everything in ``network`` a round depends on.
+
+    That is the weights, plus for a TorchSteeringNet the Adam state and the
+    replay buffer contents, since online training carries on from them.
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    arrays = list(network.parameter_arrays())
+    if isinstance(network, TorchSteeringNet):
+        for state in network.opt.state.values():
+            arrays += [torch.as_tensor(value).detach().cpu().numpy() for value in state.values()]
+        if network.buffer is not None:
+            buffer = network.buffer
+            arrays += [buffer.x[:buffer.count].cpu().numpy(), buffer.y[:buffer.count].cpu().numpy(),
+                       np.array([buffer.pos, network.steps])]
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f'{array.dtype.str}{array.shape}'.encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def genome_fingerprint(genome):
+    '''Digest of a genome.SparseChild or genome.GenomeRow that hasn't built its network yet.
+
+    That network would start from these weights with a fresh optimizer and
+    an empty replay buffer, so the architecture and the weights are all of it.
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(genome.spec, sort_keys=True).encode())
+    weights = np.ascontiguousarray(genome.weights())
+    digest.update(f'{weights.dtype.str}{weights.shape}'.encode())
+    digest.update(weights.tobytes())
+    return digest.hexdigest()
+
+
+def _network_state(network):
+    # Just what a round changes: weights, and for a TorchSteeringNet the Adam state, step count and the
+    # filled part of the replay buffer, all copied so later training can't touch them
+    if not isinstance(network, TorchSteeringNet):
+        return [np.array(array) for array in network.parameter_arrays()]
+    opt_state = network.opt.state_dict()
+    buffer = network.buffer
+    return {
+        'params': [param.detach().clone() for param in network.model.parameters()],
+        'opt': {
+            'state': {i: {k: v.clone() for k, v in state.items()} for i, state in opt_state['state'].items()},
+            'param_groups': copy.deepcopy(opt_state['param_groups']),
+        },
+        'steps': network.steps,
+        'buffer': None if buffer is None else (
+            buffer.x[:buffer.count].clone(), buffer.y[:buffer.count].clone(), buffer.pos, buffer.count,
+        ),
+    }
+
+
+def _load_network_state(network, state):
+    # In place, so networks bound to a GenomePopulation row stay bound
+    if not isinstance(network, TorchSteeringNet):
+        for array, value in zip(network.parameter_arrays(), state):
+            array[...] = value
+        return
+    with torch.no_grad():
+        for param, value in zip(network.model.parameters(), state['params']):
+            param.copy_(value)
+    # load_state_dict keeps the tensors it is given, the cached ones must stay untouched
+    opt = state['opt']
+    network.opt.load_state_dict({
+        'state': {i: {k: v.clone() for k, v in param_state.items()} for i, param_state in opt['state'].items()},
+        'param_groups': copy.deepcopy(opt['param_groups']),
+    })
+    network.steps = state['steps']
+    if state['buffer'] is not None:
+        x, y, network.buffer.pos, network.buffer.count = state['buffer']
+        network.buffer.x[:len(x)] = x
+        network.buffer.y[:len(y)] = y
+
+
+class FitnessCache:
+    '''Outcomes of seeded rounds, keyed on what went into them.
+
+    A seeded round is deterministic: the same player state, network state
+    and seed always end the same way. ``restore`` copies a stored outcome
+    (player stats and, when the network trained, its new state) onto a
+    player instead of playing the round again. The game settings are not
+    part of the key, so use one cache per Config. Keys hold the player's
+    state at the start of the round, so in run_evolution only players of
+    the same generation (unmutated siblings) can hit, and ``clear`` is
+    called after every generation.
+    '''
+    def __init__(self):
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def clear(self):
+        self._results.clear()
+
+    def key(self, player, seed):
+        state = repr(tuple(getattr(player, name) for name in PLAYER_STATE)).encode()
+        # A lazy genome is hashed as it is, building its network just for the key would defeat it
+        fingerprint = network_fingerprint(player.network) if player.genome is None else genome_fingerprint(player.genome)
+        return fingerprint, hashlib.blake2b(state, digest_size=16).hexdigest(), seed
+
+    def restore(self, player, key):
+        '''Apply the stored outcome of ``key`` to ``player``; False if there is none.'''
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+            return False
+        self.hits += 1
+        state, network_state = result
+        for name, value in state.items():
+            setattr(player, name, copy.copy(value))
+        if network_state is not None:
+            _load_network_state(player.network, network_state)
+        return True
+
+    def add(self, key, player, keep_network=True):
+        '''Store how the round of ``key`` ended for ``player``; ``keep_network`` when a hit needs its trained state.'''
+        state = {name: copy.copy(getattr(player, name)) for name in PLAYER_STATE}
+        self._results[key] = state, _network_state(player.network) if keep_network else None
@@ -0,0 +1,151 @@
+# genome.py
+import math
+
+import numpy as np
+
+from checkpoint import build_network, network_from_spec, network_spec
+
+
+class GenomePopulation:
+    '''All parameters of a population in one contiguous (population, n_params) array.
+
+    Every individual is one row. ``views(i)`` cuts row i into arrays shaped like
+    the network's parameters, and ``bind`` points a ``Network`` or
+    ``TorchSteeringNet`` at them without copying, so training writes straight
+    into the population. Selection and cloning are row indexing, and mutation
+    is one vectorized pass over the whole array.
+    '''
+    def __init__(self, shapes, size, dtype=np.float32):
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.sizes = [math.prod(shape) for shape in self.shapes]
+        self.offsets = np.concatenate(([0], np.cumsum(self.sizes))).astype(int)
+        self.n_params = int(self.offsets[-1])
+        self.params = np.zeros((size, self.n_params), dtype=dtype)
+
+    def __len__(self):
+        return len(self.params)
+
+    @classmethod
+    def from_networks(cls, networks, dtype=np.float32):
+        '''Copy the parameters of same-shaped networks into a new population.'''
+        shapes = networks[0].parameter_shapes()
+        population = cls(shapes, len(networks), dtype)
+        for i, network in enumerate(networks):
+            if network.parameter_shapes() != shapes:
+                raise ValueError("All networks in a GenomePopulation must have the same layer sizes")
+            for view, param in zip(population.views(i), network.parameter_arrays()):
+                view[...] = param
+        return population
+
+    def views(self, i):
+        '''Row i split into parameter-shaped views (no copies).'''
+        row = self.params[i]
+        return [
+            row[start:end].reshape(shape)
+            for start, end, shape in zip(self.offsets[:-1], self.offsets[1:], self.shapes)
+        ]
+
+    def bind(self, i, network):
+        '''Point ``network``'s parameters at row i.'''
+        network.bind_parameters(self.views(i))
+        return network
+
+    def select(self, indices):
+        '''New population made of the given rows, in order (duplicates allowed).'''
+        population = GenomePopulation.__new__(GenomePopulation)
+        population.shapes = self.shapes
+        population.sizes = self.sizes
+        population.offsets = self.offsets
+        population.n_params = self.n_params
+        population.params = self.params[np.asarray(indices, dtype=int)]
+        return population
+
+    def spawn(self, parents, n_children, mutation_rate=0.1, scale=0.1):
+        '''``n_children`` mutated clones of each parent row, grouped by parent.'''
+        children = self.select(np.repeat(np.asarray(parents, dtype=int), n_children))
+        children.mutate(mutation_rate, scale)
+        return children
+
+    def mutate(self, mutation_rate=0.1, scale=0.1):
+        '''Same rule as ``TorchSteeringNet.mutate``, applied to every row at once.
+
+        Each parameter is perturbed with probability ``mutation_rate`` by
+        Gaussian noise of std ``scale`` and the result is clipped to [-1, 1].
+        '''
+        mask = np.random.random_sample(self.params.shape) < mutation_rate
+        n = int(mask.sum())
+        self.params[mask] += (np.random.standard_normal(n) * scale).astype(self.params.dtype)
+        np.clip(self.params, -1.0, 1.0, out=self.params)
+
+
+
+class GenomeRow:
+    '''Row ``index`` of a GenomePopulation, bound to a new network only by ``materialize``.
+
+    Building a network (module, initialization, optimizer) costs far more
+    than spawning its row, so flat children are handed out as these and
+    pay for it when their round starts.
+    '''
+    def __init__(self, spec, population, index):
+        self.spec = spec
+        self.population = population
+        self.index = index
+
+    def weights(self):
+        return self.population.params[self.index].copy()
+
+    def materialize(self):
+        '''A new network whose parameters are views of the row.'''
+        return self.population.bind(self.index, network_from_spec(self.spec))
+
+
+class SparseChild:
+    '''A mutated child stored as its parent's weights plus the entries the mutation touched.
+
+    ``parent`` is the parent's flat parameter vector, shared by all of its
+    children, and ``indices``/``deltas`` are the mutation: ``weights`` sets
+    ``parent[indices] + deltas`` clipped to [-1, 1], the rule of
+    ``TorchSteeringNet.mutate`` (whose clip also moves unmutated weights
+    outside [-1, 1]; those are recorded with a zero delta). Until
+    ``materialize`` builds the network a child costs these two small
+    arrays. ``lineage`` is the chain of ``(parent_id, indices, deltas)``
+    records that led to the child, oldest first and ending with its own.
+    '''
+    def __init__(self, spec, parent, indices, deltas, lineage=()):
+        self.spec = spec
+        self.parent = parent
+        self.indices = indices
+        self.deltas = deltas
+        self.lineage = lineage
+
+    @classmethod
+    def spawn(cls, network, n_children, mutation_rate=0.1, scale=0.1, parent_id=None, lineage=()):
+        '''``n_children`` mutated children of ``network``, sharing one copy of its weights.
+
+        ``parent_id`` and the parent's ``lineage`` start each child's lineage.
+        '''
+        spec = network_spec(network)
+        parent = np.concatenate([np.ravel(a) for a in network.parameter_arrays()])
+        outside = np.flatnonzero(np.abs(parent) > 1.0)
+        children = []
+        for _ in range(n_children):
+            mutated = np.flatnonzero(np.random.random_sample(parent.size) < mutation_rate)
+            indices = np.union1d(mutated, outside).astype(np.int32)
+            deltas = np.zeros(len(indices), dtype=parent.dtype)
+            deltas[np.searchsorted(indices, mutated)] = np.random.standard_normal(len(mutated)) * scale
+            children.append(cls(spec, parent, indices, deltas, lineage + ((parent_id, indices, deltas),)))
+        return children
+
+    @property
+    def nbytes(self):
+        '''Size of the mutation record, the parent's weights excluded.'''
+        return self.indices.nbytes + self.deltas.nbytes
+
+    def weights(self):
+        weights = self.parent.copy()
+        weights[self.indices] = np.clip(weights[self.indices] + self.deltas, -1.0, 1.0)
+        return weights
+
+    def materialize(self):
+        '''A new network with the child's weights and a fresh optimizer, like ``network.copy()``.'''
+        return build_network(self.spec, self.weights())
@@ -1,22 +1,27 @@
+import itertools
 import random as rn
 import weakref
 import math
 import time
-from random import randrange
+
+import numpy as np
 
 
 class Particle:
     _instances = set()
 
-    def __init__(self, name, window_dim):
+    def __init__(self, name, window_dim, rng=None):
+        # rng: a random.Random for seeded rounds, None uses the global random state
+        rng = rng if rng is not None else rn
         self.windowWidth, self.windowHeight = window_dim
-        self.x = rn.randint(20, self.windowWidth-20)
-        self.y = rn.randint(0, self.windowHeight)
+        self.x = rng.randint(20, self.windowWidth-20)
+        self.y = rng.randint(0, self.windowHeight)
         self.name = name
+        self.grid = None
         self._instances.add(weakref.ref(self))
-        self.R = randrange(0, 255)
-        self.G = randrange(0, 255)
-        self.B = randrange(0, 255)
+        self.R = rng.randrange(0, 255)
+        self.G = rng.randrange(0, 255)
+        self.B = rng.randrange(0, 255)
 
     def moveRight(self):
         # Use brownian motion:
@@ -48,17 +53,19 @@ class Particle:
 class Killer:
     _instances = set()
 
-    def __init__(self, name, window_dim):
+    def __init__(self, name, window_dim, rng=None):
+        rng = rng if rng is not None else rn
         self.name = name
         self.windowWidth, self.windowHeight = window_dim
-        self.x = rn.randint(int(self.windowWidth-(self.windowWidth*0.2)), self.windowWidth)
-        self.y = rn.randint(0, self.windowHeight)
+        self.x = rng.randint(int(self.windowWidth-(self.windowWidth*0.2)), self.windowWidth)
+        self.y = rng.randint(0, self.windowHeight)
         self.level = 1
         self.size = 3
         self.fill = 1
         self.R = 255
         self.G = 0
         self.B = 0
+        self.grid = None
         self._instances.add(weakref.ref(self))
 
     def moveRight(self):
@@ -103,12 +110,156 @@ class Killer:
         cls._instances -= dead  # Not in use
 
 
+def brownian_motion(store, step=4):
+    '''The Brownian motion sketched in Particle.moveRight/moveUp, for every entity at once.'''
+    n = len(store)
+    store.x += store.np_rng.randint(-step, step + 1, n)
+    store.x %= store.windowWidth
+    store.y += store.np_rng.randint(-step, step + 1, n)
+    store.y %= store.windowHeight
+
+
+def _store_field(name, cast):
+    def get(self):
+        return cast(getattr(self.store, name)[self.index])
+
+    def set(self, value):
+        getattr(self.store, name)[self.index] = value
+    return property(get, set)
+
+
+class EntityHandle:
+    '''One entity of an EntityStore, with the attributes of a Particle/Killer.'''
+    __slots__ = ('store', 'index', 'grid')
+
+    x = _store_field('x', float)
+    y = _store_field('y', float)
+    R = _store_field('R', int)
+    G = _store_field('G', int)
+    B = _store_field('B', int)
+    level = _store_field('level', int)
+    size = _store_field('size', int)
+    fill = _store_field('fill', int)
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        self.grid = None
+
+    @property
+    def name(self):
+        return f'{self.store.kind}_{self.index}'
+
+    def moveRight(self):
+        # Motion is applied to the whole store by EntityStore.step
+        pass
+
+    def moveUp(self):
+        pass
+
+    def level_up(self):
+        Killer.level_up(self)
+
+
+class EntityStore:
+    '''Particles or killers as typed arrays instead of one object each.
+
+    Positions are float64, colours/size/fill uint8 and level int32, about
+    25 bytes per entity. ``motion`` is called as ``motion(store)`` by
+    ``step`` once per tick and moves every entity at once (see
+    ``brownian_motion``); None keeps them static like Particle and Killer.
+    ``rng`` is a random.Random for seeded rounds, used for spawning and
+    respawning; motion then draws from a numpy RandomState seeded from it.
+    Indexing or iterating gives EntityHandle objects, created on first use
+    and kept, for code that works with single entities.
+    '''
+    def __init__(self, kind, n, window_dim, motion=None, rng=None):
+        self.kind = kind
+        self.windowWidth, self.windowHeight = window_dim
+        self.x = np.zeros(n)
+        self.y = np.zeros(n)
+        self.R = np.zeros(n, dtype=np.uint8)
+        self.G = np.zeros(n, dtype=np.uint8)
+        self.B = np.zeros(n, dtype=np.uint8)
+        self.level = np.zeros(n, dtype=np.int32)
+        self.size = np.zeros(n, dtype=np.uint8)
+        self.fill = np.zeros(n, dtype=np.uint8)
+        self.motion = motion
+        self.rng = rng if rng is not None else rn
+        self._np_rng = None
+        self._handles = [None] * n
+
+    @classmethod
+    def particles(cls, n, window_dim, motion=None, rng=None):
+        '''``n`` particles, drawn exactly like n Particle instances.'''
+        store = cls('particle', n, window_dim, motion, rng)
+        for i in range(n):
+            store.x[i] = store.rng.randint(20, store.windowWidth-20)
+            store.y[i] = store.rng.randint(0, store.windowHeight)
+            store.R[i] = store.rng.randrange(0, 255)
+            store.G[i] = store.rng.randrange(0, 255)
+            store.B[i] = store.rng.randrange(0, 255)
+        # Particles are drawn as radius 4, width 3 circles
+        store.size[:] = 4
+        store.fill[:] = 3
+        return store
+
+    @classmethod
+    def killers(cls, n, window_dim, motion=None, rng=None):
+        '''``n`` killers, drawn exactly like n Killer instances.'''
+        store = cls('killer', n, window_dim, motion, rng)
+        for i in range(n):
+            store.x[i] = store.rng.randint(int(store.windowWidth-(store.windowWidth*0.2)), store.windowWidth)
+            store.y[i] = store.rng.randint(0, store.windowHeight)
+        store.level[:] = 1
+        store.size[:] = 3
+        store.fill[:] = 1
+        store.R[:] = 255
+        return store
+
+    @property
+    def np_rng(self):
+        # Made on first use, so a store without motion draws exactly what Particle/Killer objects would
+        if self._np_rng is None:
+            self._np_rng = np.random.RandomState(self.rng.getrandbits(32)) if self.rng is not rn else np.random
+        return self._np_rng
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __getitem__(self, i):
+        handle = self._handles[i]
+        if handle is None:
+            handle = EntityHandle(self, range(len(self))[i])
+            self._handles[i] = handle
+        return handle
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def respawn(self, i):
+        '''Move entity ``i`` to a random spot, as view.coll does with an eaten particle.'''
+        self.x[i] = self.rng.randint(0, self.windowWidth)
+        self.y[i] = self.rng.randint(0, self.windowHeight)
+
+    def step(self):
+        if self.motion is not None:
+            self.motion(self)
+
+
 class Player:
     _instances = set()
+    _ids = itertools.count()
 
-    def __init__(self, window_dim, network, use_network):
+    def __init__(self, window_dim, network, use_network, genome=None):
         self.windowWidth, self.windowHeight = window_dim
-        self.network = network
+        self.id = next(Player._ids)
+        self._network = network
+        # genome.SparseChild or genome.GenomeRow to build the network from on first use, when network is None
+        self.genome = genome
+        # (parent id, indices, deltas) of each sparse mutation that led here, kept after the genome is built
+        self.lineage = getattr(genome, 'lineage', ())
         self.level = 20
         self.size = 3
         self.fill = 1
@@ -121,6 +272,18 @@ class Player:
         self.use_network = use_network
         self.level_data = []
 
+    @property
+    def network(self):
+        if self._network is None and self.genome is not None:
+            self._network = self.genome.materialize()
+            self.genome = None
+        return self._network
+
+    @network.setter
+    def network(self, network):
+        self._network = network
+        self.genome = None
+
     def moveRight(self):
         self.x = (self.x + self.speed) % self.windowWidth
 
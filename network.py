@@ -4,7 +4,7 @@ import numpy as np
 
 
 class Network(object):
-    def __init__(self, sizes):
+    def __init__(self, sizes, dtype=np.float64):
         """The list ``sizes`` contains the number of neurons in the
         respective layers of the network.  For example, if the list
         was [2, 3, 1] then it would be a three-layer network, with the
@@ -14,11 +14,41 @@ class Network(object):
         distribution with mean 0, and variance 1.  Note that the first
         layer is assumed to be an input layer, and by convention we
         won't set any biases for those neurons, since biases are only
-        ever used in computing the outputs from later layers."""
+        ever used in computing the outputs from later layers.
+        ``dtype`` sets the precision of the weights, biases and all
+        training buffers, e.g. ``np.float32`` for large training sets."""
         self.num_layers = len(sizes)
         self.sizes = sizes
-        self.biases = [np.random.randn(y, 1) for y in sizes[1:]]
-        self.weights = [np.random.randn(y, x) for x, y in zip(sizes[:-1], sizes[1:])]
+        self.dtype = np.dtype(dtype)
+        self.biases = [np.random.randn(y, 1).astype(self.dtype) for y in sizes[1:]]
+        self.weights = [np.random.randn(y, x).astype(self.dtype) for x, y in zip(sizes[:-1], sizes[1:])]
+        # Gradient buffers, reused by every backprop call
+        self._nabla_b = [np.zeros(b.shape, dtype=self.dtype) for b in self.biases]
+        self._nabla_w = [np.zeros(w.shape, dtype=self.dtype) for w in self.weights]
+
+    def parameter_arrays(self):
+        """The weights and biases interleaved layer by layer, the
+        order used by ``bind_parameters``."""
+        arrays = []
+        for w, b in zip(self.weights, self.biases):
+            arrays += [w, b]
+        return arrays
+
+    def parameter_shapes(self):
+        """Shapes of the arrays returned by ``parameter_arrays``."""
+        return [a.shape for a in self.parameter_arrays()]
+
+    def bind_parameters(self, arrays):
+        """Use ``arrays`` (ordered as in ``parameter_shapes``) as the
+        network's weights and biases without copying them. Training
+        updates them in place, so the owner of the arrays sees every
+        change."""
+        self.weights = list(arrays[0::2])
+        self.biases = list(arrays[1::2])
+        if arrays and arrays[0].dtype != self.dtype:
+            self.dtype = arrays[0].dtype
+            self._nabla_b = [np.zeros(b.shape, dtype=self.dtype) for b in self.biases]
+            self._nabla_w = [np.zeros(w.shape, dtype=self.dtype) for w in self.weights]
 
     def feedforward_sigmoid(self, a):
         """Return the output of the network if ``a`` is input."""
@@ -93,62 +123,62 @@ class Network(object):
         gradient descent using backpropagation to a single mini batch.
         The ``mini_batch`` may be either:
           - a list of (x, y) tuples, or
-          - a single tuple (x, y) where x,y are arrays.
-        ``eta`` is the learning rate.
+          - a single tuple (x, y) where x is an (n, batch) matrix with
+            one sample per column and y is the matching (2, batch) matrix.
+        The whole batch goes through one forward/backward pass and the
+        weights and biases are updated in place. ``eta`` is the learning
+        rate. Returns the output activations of the batch, or of the last
+        sample when given a list.
         """
-        # initialize accumulators
-        nabla_b = [np.zeros(b.shape) for b in self.biases]
-        nabla_w = [np.zeros(w.shape) for w in self.weights]
-
-        # handle either a single (x,y) or a list of (x,y)
         if isinstance(mini_batch, tuple) and len(mini_batch) == 2:
-            # single sample
             x, y = mini_batch
-            batch_size = 1
-            delta_nabla_b, delta_nabla_w, activations = self.backprop(x, y)
-            nabla_b = [nb + dnb for nb, dnb in zip(nabla_b, delta_nabla_b)]
-            nabla_w = [nw + dnw for nw, dnw in zip(nabla_w, delta_nabla_w)]
+            last_only = False
         else:
-            # assume iterable of (x,y)
             samples = list(mini_batch)
-            batch_size = len(samples)
-            for x, y in samples:
-                dnb, dnw, _ = self.backprop(x, y)
-                nabla_b = [nb + dnb_i for nb, dnb_i in zip(nabla_b, dnb)]
-                nabla_w = [nw + dnw_i for nw, dnw_i in zip(nabla_w, dnw)]
-
-            # activations: return last computed sample's activations (if any)
-            activations = None
-            if batch_size > 0:
-                # compute forward for the last sample to return activations
-                activations = self.feedforward(samples[-1][0])
+            if not samples:
+                return None
+            x = np.hstack([s[0] for s in samples])
+            y = np.hstack([s[1] for s in samples])
+            last_only = True
+
+        batch_size = x.shape[1]
+        nabla_b, nabla_w, activations = self.backprop(x, y)
 
         # apply gradient descent step using correct batch_size
-        self.weights = [w - (eta / batch_size) * nw for w, nw in zip(self.weights, nabla_w)]
-        self.biases = [b - (eta / batch_size) * nb for b, nb in zip(self.biases, nabla_b)]
+        scale = eta / batch_size
+        for w, nw in zip(self.weights, nabla_w):
+            nw *= scale
+            w -= nw
+        for b, nb in zip(self.biases, nabla_b):
+            nb *= scale
+            b -= nb
 
-        return activations
+        return activations[:, -1:] if last_only else activations
 
     def backprop(self, x, y):
-        """Return a tuple ``(nabla_b, nabla_w)`` representing the
-        gradient for the cost function C_x.  ``nabla_b`` and
+        """Return a tuple ``(nabla_b, nabla_w, activation)`` with the
+        gradient for the cost function summed over the columns of ``x``
+        and ``y``, plus the output activations. ``nabla_b`` and
         ``nabla_w`` are layer-by-layer lists of numpy arrays, similar
-        to ``self.biases`` and ``self.weights``."""
-        nabla_b = [np.zeros(b.shape) for b in self.biases]
-        nabla_w = [np.zeros(w.shape) for w in self.weights]
+        to ``self.biases`` and ``self.weights``. They are the network's
+        reusable gradient buffers and are overwritten by the next call."""
+        x = np.asarray(x, dtype=self.dtype)
+        y = np.asarray(y, dtype=self.dtype)
+        nabla_b, nabla_w = self._nabla_b, self._nabla_w
         # feedforward
         activation = x
         activations = [x]  # list to store all the activations, layer by layer
         zs = []  # list to store all the z vectors, layer by layer
         for b, w in zip(self.biases, self.weights):
-            z = np.dot(w, activation)+b
+            z = np.dot(w, activation)
+            z += b
             zs.append(z)
             activation = sigmoid(z)
             activations.append(activation)
         # backward pass
         delta = self.cost_derivative(activations[-1], y) * (1 - np.tanh(zs[-1])**2)
-        nabla_b[-1] = delta
-        nabla_w[-1] = np.dot(delta, activations[-2].transpose())
+        np.sum(delta, axis=1, keepdims=True, out=nabla_b[-1])
+        np.dot(delta, activations[-2].T, out=nabla_w[-1])
         # Note that the variable l in the loop below is used a little
         # differently to the notation in Chapter 2 of the book.  Here,
         # l = 1 means the last layer of neurons, l = 2 is the
@@ -158,9 +188,9 @@ class Network(object):
         for layer in range(2, self.num_layers):
             z = zs[-layer]
             sp = sigmoid_prime(z)
-            delta = np.dot(self.weights[-layer+1].transpose(), delta) * sp
-            nabla_b[-layer] = delta
-            nabla_w[-layer] = np.dot(delta, activations[-layer-1].transpose())
+            delta = np.dot(self.weights[-layer+1].T, delta) * sp
+            np.sum(delta, axis=1, keepdims=True, out=nabla_b[-layer])
+            np.dot(delta, activations[-layer-1].T, out=nabla_w[-layer])
         return nabla_b, nabla_w, activations[-1]
 
     def evaluate(self, test_data):
@@ -0,0 +1,68 @@
+# numpy_policy.py
+import argparse
+
+import numpy as np
+
+
+class NumpyPolicy:
+    '''Frozen forward pass of torch_network._MLP in plain numpy.
+
+    Loads the .npz written by ``torch_network.export_numpy_policy`` and never
+    imports torch. All intermediate buffers are allocated once, so a
+    ``predict`` call allocates nothing; the returned array is one of those
+    buffers and is overwritten by the next call.
+    '''
+    def __init__(self, params):
+        self.w1 = np.ascontiguousarray(params['fc1_weight'], dtype=np.float32)
+        self.b1 = np.ascontiguousarray(params['fc1_bias'], dtype=np.float32)
+        self.w2 = np.ascontiguousarray(params['fc2_weight'], dtype=np.float32)
+        self.b2 = np.ascontiguousarray(params['fc2_bias'], dtype=np.float32)
+        self.w3 = np.ascontiguousarray(params['out_weight'], dtype=np.float32)
+        self.b3 = np.ascontiguousarray(params['out_bias'], dtype=np.float32)
+        self.input_dim = self.w1.shape[1]
+        self._x = np.empty(self.input_dim, dtype=np.float32)
+        self._h1 = np.empty(self.w1.shape[0], dtype=np.float32)
+        self._h2 = np.empty(self.w2.shape[0], dtype=np.float32)
+        self._out = np.empty(self.w3.shape[0], dtype=np.float32)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def predict(self, x_np):
+        x = self._x
+        x[...] = x_np.reshape(-1)
+        np.dot(self.w1, x, out=self._h1)
+        self._h1 += self.b1
+        np.maximum(self._h1, 0, out=self._h1)
+        np.dot(self.w2, self._h1, out=self._h2)
+        self._h2 += self.b2
+        np.maximum(self._h2, 0, out=self._h2)
+        np.dot(self.w3, self._h2, out=self._out)
+        self._out += self.b3
+        return np.tanh(self._out, out=self._out)
+
+
+if __name__ == "__main__":
+    # Watch an exported policy play without torch: python numpy_policy.py policy.npz
+    from view import App
+    from model import Player, Particle, Killer
+
+    parser = argparse.ArgumentParser(description='Run an exported policy in inference-only mode.')
+    parser.add_argument('policy')
+    parser.add_argument('--particles', type=int, default=3)
+    parser.add_argument('--killers', type=int, default=2)
+    parser.add_argument('--k-nearest', type=int, default=None)
+    parser.add_argument('--rounds', type=int, default=5000)
+    parser.add_argument('--headless', action='store_true')
+    args = parser.parse_args()
+
+    window_dim = 600, 600
+    player = Player(window_dim, NumpyPolicy.load(args.policy), True)
+    particles = [Particle(f'particle_{i}', window_dim) for i in range(args.particles)]
+    killers = [Killer(f'killer_{i}', window_dim) for i in range(args.killers)]
+    A = App(player, particles, killers, window_dim, eta=0.1, round_limit=args.rounds, render=not args.headless,
+            k_nearest=args.k_nearest, train_network=False)
+    A.run()
+    print(f'final level {player.level}, max level {max(player.level_data, default=player.level)}')
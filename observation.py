@@ -0,0 +1,120 @@
+# observation.py
+import math
+
+import numpy as np
+
+
+def wrapped_offset(d, length):
+    '''Shortest signed offset along one axis of the toroidal window.'''
+    return (d + length / 2) % length - length / 2
+
+
+def knearest_input_dim(k):
+    '''Network input size for the k-nearest observation: player plus k particles and k killers.'''
+    return 2 * (1 + 2 * k)
+
+
+class KNearestEncoder:
+    '''Fixed-size network input built from the k nearest particles and killers.
+
+    The layout follows the full observation in ``App._update_npc_positions``:
+    the player's normalized position, then (dx, dy) / diag for each slot,
+    particles first and killers after, nearest first. Offsets are wrapped
+    across the window edges. Empty slots (fewer than k entities) are zero
+    and do not count towards the target direction.
+    '''
+    def __init__(self, window_dim, k=3):
+        self.windowWidth, self.windowHeight = window_dim
+        self.k = k
+        self.input_dim = knearest_input_dim(k)
+        self.diag = math.hypot(self.windowWidth, self.windowHeight)
+
+    def encode(self, player, particle_grid, killer_grid, eaten=(), hit=(), out=None):
+        '''Return ``(coord_array, y_target)``; ``out`` is a pair of arrays to fill in place instead.'''
+        if out is None:
+            coord_array = np.zeros((self.input_dim, 1), dtype=np.float32)
+            y_target = np.zeros((2, 1), dtype=np.float32)
+        else:
+            coord_array, y_target = out
+            coord_array.fill(0)
+        coord_array[0] = player.x / self.windowWidth
+        coord_array[1] = player.y / self.windowHeight
+
+        dx_target = dy_target = total = 0.0
+        for first_slot, grid, touched, score_hit, score_far in (
+            (1, particle_grid, eaten, 1.0, 0.1),
+            (1 + self.k, killer_grid, hit, -1.0, -0.2),
+        ):
+            for slot, (_, obj) in enumerate(grid.nearest(player.x, player.y, self.k), first_slot):
+                dx = wrapped_offset(obj.x - player.x, self.windowWidth) / self.diag
+                dy = wrapped_offset(obj.y - player.y, self.windowHeight) / self.diag
+                coord_array[2*slot] = dx
+                coord_array[2*slot+1] = dy
+                score = score_hit if obj in touched else score_far
+                dx_target += dx * score
+                dy_target += dy * score
+                total += abs(score)
+
+        _unit_target(y_target, dx_target, dy_target, total)
+        return coord_array, y_target
+
+    def encode_arrays(self, player, particles, killers, eaten=(), hit=(), out=None):
+        '''``encode`` for model.EntityStore particles and killers, with ``eaten``/``hit`` as index arrays.'''
+        if out is None:
+            out = np.zeros((self.input_dim, 1), dtype=np.float32), np.zeros((2, 1), dtype=np.float32)
+        coord_array, y_target = out
+        coord = coord_array.reshape(-1)
+        coord[0] = player.x / self.windowWidth
+        coord[1] = player.y / self.windowHeight
+
+        dx_target = dy_target = total = 0.0
+        for first_slot, store, touched, score_hit, score_far in (
+            (1, particles, eaten, 1.0, 0.1),
+            (1 + self.k, killers, hit, -1.0, -0.2),
+        ):
+            dx = wrapped_offset(store.x - player.x, self.windowWidth) / self.diag
+            dy = wrapped_offset(store.y - player.y, self.windowHeight) / self.diag
+            dx, dy, index, valid = (a[0] for a in nearest_slots(dx[None], dy[None], self.k))
+            scores = np.where(np.isin(index, touched), score_hit, score_far) * valid
+            coord[2*first_slot:2*(first_slot + self.k):2] = dx
+            coord[2*first_slot+1:2*(first_slot + self.k):2] = dy
+            dx_target += float(dx @ scores)
+            dy_target += float(dy @ scores)
+            total += float(np.abs(scores).sum())
+
+        _unit_target(y_target, dx_target, dy_target, total)
+        return coord_array, y_target
+
+
+def _unit_target(y_target, dx_target, dy_target, total):
+    '''Write the score-weighted mean offset into ``y_target`` as a unit vector.'''
+    total += 1e-6
+    dx_target /= total
+    dy_target /= total
+    norm = math.hypot(dx_target, dy_target) + 1e-6
+    y_target[0] = dx_target / norm
+    y_target[1] = dy_target / norm
+
+
+def nearest_slots(dx, dy, k):
+    '''Pick the k smallest offsets per row of ``(N, E)`` offset arrays.
+
+    Returns ``(dx, dy, index, valid)`` with shape ``(N, k)``; when E < k the
+    extra slots are zero and ``valid`` is False.
+    '''
+    n, e = dx.shape
+    out_dx = np.zeros((n, k))
+    out_dy = np.zeros((n, k))
+    index = np.zeros((n, k), dtype=np.int64)
+    valid = np.zeros((n, k), dtype=bool)
+    m = min(k, e)
+    if m == 0:
+        return out_dx, out_dy, index, valid
+    dist = np.hypot(dx, dy)
+    order = np.argsort(dist, axis=1)[:, :m] if m == e else np.argpartition(dist, m - 1, axis=1)[:, :m]
+    order = np.take_along_axis(order, np.argsort(np.take_along_axis(dist, order, axis=1), axis=1), axis=1)
+    out_dx[:, :m] = np.take_along_axis(dx, order, axis=1)
+    out_dy[:, :m] = np.take_along_axis(dy, order, axis=1)
+    index[:, :m] = order
+    valid[:, :m] = True
+    return out_dx, out_dy, index, valid
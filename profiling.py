@@ -0,0 +1,116 @@
+# profiling.py
+import csv
+import json
+import time
+from collections import defaultdict
+
+
+class PhaseProfiler:
+    '''Wall-clock timers and counters for the phases of one App round.
+
+    ``wrap`` returns a timed version of a method; App swaps its own methods
+    for these when a profiler is given, so an App without one runs the
+    untouched methods. Phase times are exclusive: time spent in a nested
+    wrapped phase (collisions inside observations) is only counted once.
+    '''
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.ticks = 0
+        self.wall_seconds = 0.0
+        self._nested = [0.0]
+        self._start = None
+
+    def wrap(self, name, func, counters=None):
+        '''Time every call of ``func`` under ``name``; ``counters`` maps counter names to fn(result) -> int.'''
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            self._nested.append(0.0)
+            start = perf_counter()
+            result = func(*args, **kwargs)
+            elapsed = perf_counter() - start
+            self.seconds[name] += elapsed - self._nested.pop()
+            self.calls[name] += 1
+            self._nested[-1] += elapsed
+            if counters:
+                for counter, count in counters.items():
+                    self.counters[counter] += count(result)
+            return result
+        return timed
+
+    def begin(self):
+        self._start = time.perf_counter()
+
+    def end(self, ticks):
+        self.wall_seconds += time.perf_counter() - self._start
+        self.ticks += ticks
+
+    def summary(self):
+        return {
+            'ticks': self.ticks,
+            'wall_seconds': self.wall_seconds,
+            'phases': {name: {'seconds': self.seconds[name], 'calls': self.calls[name]} for name in self.seconds},
+            'counters': dict(self.counters),
+        }
+
+
+def merge_summaries(summaries):
+    '''Sum a list of ``PhaseProfiler.summary()`` dicts.'''
+    total = {'ticks': 0, 'wall_seconds': 0.0, 'phases': {}, 'counters': defaultdict(int)}
+    for summary in summaries:
+        total['ticks'] += summary['ticks']
+        total['wall_seconds'] += summary['wall_seconds']
+        for name, phase in summary['phases'].items():
+            merged = total['phases'].setdefault(name, {'seconds': 0.0, 'calls': 0})
+            merged['seconds'] += phase['seconds']
+            merged['calls'] += phase['calls']
+        for name, count in summary['counters'].items():
+            total['counters'][name] += count
+    total['counters'] = dict(total['counters'])
+    return total
+
+
+class ProfileLog:
+    '''Round profiles collected over a run_evolution, aggregated per generation.'''
+    def __init__(self):
+        self.rounds = []
+
+    def add_round(self, generation, summary):
+        self.rounds.append({'generation': generation, 'round': len(self.rounds), **summary})
+
+    def generations(self):
+        by_generation = defaultdict(list)
+        for entry in self.rounds:
+            by_generation[entry['generation']].append(entry)
+        return [
+            {'generation': generation, 'rounds': len(entries), **merge_summaries(entries)}
+            for generation, entries in sorted(by_generation.items())
+        ]
+
+    def write_json(self, path):
+        with open(path, 'w') as file:
+            json.dump({'generations': self.generations(), 'rounds': self.rounds}, file, indent=1)
+
+    def write_csv(self, path):
+        '''One row per round plus one total row per generation (round column "all").'''
+        rows = [_flatten(entry) for entry in self.rounds]
+        rows += [_flatten({**entry, 'round': 'all'}) for entry in self.generations()]
+        fields = []
+        for row in rows:
+            fields += [key for key in row if key not in fields]
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def _flatten(entry):
+    row = {'generation': entry['generation'], 'round': entry['round'],
+           'ticks': entry['ticks'], 'wall_seconds': entry['wall_seconds']}
+    for name, phase in entry['phases'].items():
+        row[f'{name}_seconds'] = phase['seconds']
+        row[f'{name}_calls'] = phase['calls']
+    row.update(entry['counters'])
+    return row
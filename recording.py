@@ -0,0 +1,147 @@
+# recording.py
+import json
+import struct
+import sys
+
+import numpy as np
+
+from model import EntityStore
+
+MAGIC = b'NNGAME-EPISODE1\n'
+
+
+def episode_dtype(n_particles, n_killers):
+    '''One record per tick: player state and action, entity positions and killer levels.'''
+    return np.dtype([
+        ('tick', '<i4'),
+        ('player', '<f4', (2,)),
+        ('action', '<f4', (2,)),
+        ('level', '<i4'),
+        ('size', 'u1'),
+        ('fill', 'u1'),
+        ('rgb', 'u1', (3,)),
+        ('particles', '<f4', (n_particles, 2)),
+        ('killers', '<f4', (n_killers, 2)),
+        ('killer_level', '<i2', (n_killers,)),
+    ])
+
+
+class EpisodeRecorder:
+    '''Streams an App's per-tick state into a compact binary file.
+
+    The file is a short JSON header (window size, entity counts and the
+    entity colours/sizes that never change) followed by fixed-size records of
+    ``episode_dtype``. Records are collected in a preallocated chunk and
+    appended to the file whenever the chunk fills up, so recording costs one
+    array row per tick.
+    '''
+    def __init__(self, path, chunk_size=1024):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._file = None
+        self._chunk = None
+        self._n = 0
+
+    def begin(self, app):
+        n_particles, n_killers = len(app.particles), len(app.killers)
+        header = json.dumps({
+            'window_dim': [app.windowWidth, app.windowHeight],
+            'n_particles': n_particles,
+            'n_killers': n_killers,
+            'particle_rgb': [[obj.R, obj.G, obj.B] for obj in app.particles],
+            'killer_rgb': [[obj.R, obj.G, obj.B] for obj in app.killers],
+            'killer_size': [obj.size for obj in app.killers],
+            'killer_fill': [obj.fill for obj in app.killers],
+        }).encode()
+        # Pad so the records start on an 8-byte boundary
+        header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 8)
+        self._file = open(self.path, 'wb')
+        self._file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        self._chunk = np.zeros(self.chunk_size, dtype=episode_dtype(n_particles, n_killers))
+        self._n = 0
+
+    def record(self, app, action=(0.0, 0.0)):
+        row = self._chunk[self._n]
+        player = app.player
+        row['tick'] = app.round_count
+        row['player'] = (player.x, player.y)
+        row['action'] = action
+        row['level'] = player.level
+        row['size'] = player.size
+        row['fill'] = player.fill
+        row['rgb'] = (player.R, player.G, player.B)
+        particles, killers = app.particles, app.killers
+        if isinstance(particles, EntityStore) and isinstance(killers, EntityStore):
+            row['particles'][:, 0] = particles.x
+            row['particles'][:, 1] = particles.y
+            row['killers'][:, 0] = killers.x
+            row['killers'][:, 1] = killers.y
+            row['killer_level'] = killers.level
+        else:
+            for i, obj in enumerate(particles):
+                row['particles'][i] = (obj.x, obj.y)
+            for i, obj in enumerate(killers):
+                row['killers'][i] = (obj.x, obj.y)
+                row['killer_level'][i] = obj.level
+        self._n += 1
+        if self._n == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        self._chunk[:self._n].tofile(self._file)
+        self._file.flush()
+        self._n = 0
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+
+
+def read_episode(path):
+    '''Return ``(header, records)`` with the records memory-mapped read-only.'''
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an episode recording")
+        (length,) = struct.unpack('<I', file.read(4))
+        header = json.loads(file.read(length))
+    offset = len(MAGIC) + 4 + length
+    dtype = episode_dtype(header['n_particles'], header['n_killers'])
+    records = np.memmap(path, dtype=dtype, mode='r', offset=offset)
+    return header, records
+
+
+def replay(path, max_fps=60, ticks_per_frame=1):
+    '''Render a recorded episode with pygame, no network or simulation involved.'''
+    import pygame
+    from pygame.locals import K_ESCAPE
+
+    header, records = read_episode(path)
+    pygame.init()
+    surface = pygame.display.set_mode(tuple(header['window_dim']), pygame.HWSURFACE)
+    pygame.display.set_caption(f'Replay: {path}')
+    clock = pygame.time.Clock()
+    killers = list(zip(header['killer_rgb'], header['killer_size'], header['killer_fill']))
+
+    for row in records[::ticks_per_frame]:
+        pygame.event.pump()
+        if pygame.key.get_pressed()[K_ESCAPE]:
+            break
+        surface.fill((0, 0, 0))
+        x, y = row['player']
+        pygame.draw.circle(surface, tuple(int(c) for c in row['rgb']), (int(x), int(y)), int(row['size']), int(row['fill']))
+        for (px, py), rgb in zip(row['particles'], header['particle_rgb']):
+            pygame.draw.circle(surface, rgb, (int(px), int(py)), 4, 3)
+        for (kx, ky), (rgb, size, fill) in zip(row['killers'], killers):
+            pygame.draw.circle(surface, rgb, (int(kx), int(ky)), size, fill)
+        pygame.display.flip()
+        clock.tick(max_fps)
+
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    # python recording.py episode.bin [ticks_per_frame]
+    replay(sys.argv[1], ticks_per_frame=int(sys.argv[2]) if len(sys.argv) > 2 else 1)
@@ -0,0 +1,177 @@
+# reinforce.py
+from __future__ import annotations
+
+import argparse
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+
+from batch_engine import BatchWorld
+from model import Player
+from observation import knearest_input_dim
+from torch_network import TorchNetConfig, _MLP
+
+
+@dataclass
+class ReinforceConfig:
+    # Games played in lockstep per set of rollouts, and their length in ticks
+    n_worlds: int = 64
+    episode_ticks: int = 1000
+    iterations: int = 200
+    # k nearest particles/killers as input (None feeds every entity, like App's full observation)
+    k_nearest: Optional[int] = 2
+    n_particles: int = 3
+    n_killers: int = 2
+    window_dim: Tuple[int, int] = (600, 600)
+    hidden1: int = 64
+    hidden2: int = 64
+    lr: float = 1e-3
+    # Discount for the returns and std of the Gaussian exploration around the policy's direction
+    gamma: float = 0.99
+    sigma: float = 0.3
+    checkpoint_path: str = "networks/policy_reinforce.pt"
+    checkpoint_every: int = 10
+    seed: int = 0
+
+
+class ReinforceTrainer:
+    """
+    REINFORCE for the steering policy, an _MLP as in TorchSteeringNet.
+
+    Every iteration plays n_worlds full episodes at once in a BatchWorld, the
+    policy acting for all worlds in one batched forward pass per tick. The
+    action is the policy output plus Gaussian noise (std sigma), and the
+    reward of a tick is the player's level change. Then comes a single
+    gradient step on the whole set of rollouts: log-probabilities of the taken
+    actions, weighted by their discounted returns minus the mean return of the
+    worlds still alive at that tick. Checkpoints are the _MLP state_dict, so
+    TorchSteeringNet(trainer.net_config()).load(path) picks them up.
+    """
+    def __init__(self, cfg: ReinforceConfig):
+        self.cfg = cfg
+        if cfg.k_nearest is None:
+            self.input_dim = 2 * (1 + cfg.n_particles + cfg.n_killers)
+        else:
+            self.input_dim = knearest_input_dim(cfg.k_nearest)
+        self.model = _MLP(self.input_dim, cfg.hidden1, cfg.hidden2)
+        self.opt = torch.optim.Adam(self.model.parameters(), lr=cfg.lr)
+
+    def net_config(self) -> TorchNetConfig:
+        """TorchNetConfig of a TorchSteeringNet that can load this trainer's checkpoints."""
+        return TorchNetConfig(input_dim=self.input_dim, hidden1=self.cfg.hidden1, hidden2=self.cfg.hidden2, lr=self.cfg.lr)
+
+    @torch.no_grad()
+    def collect(self) -> dict:
+        """
+        Play one set of episodes. Returns obs [T, N, D], actions [T, N, 2],
+        rewards [T, N] and mask [T, N] (the world was alive when it acted).
+        """
+        cfg = self.cfg
+        T, N = cfg.episode_ticks, cfg.n_worlds
+        players = [Player(cfg.window_dim, None, True) for _ in range(N)]
+        world = BatchWorld(players, cfg.n_particles, cfg.n_killers, cfg.window_dim, 0.0, T, k_nearest=cfg.k_nearest)
+        obs = np.zeros((T, N, self.input_dim), dtype=np.float32)
+        actions = np.zeros((T, N, 2), dtype=np.float32)
+        rewards = np.zeros((T, N), dtype=np.float32)
+        mask = np.zeros((T, N), dtype=bool)
+
+        # The collisions caused by the move at tick t are resolved at the start of tick t + 1
+        for t in range(T + 1):
+            level = world.level.copy()
+            coord_array, _ = world._update_npc_positions()
+            if t > 0:
+                rewards[t - 1] = np.where(mask[t - 1], world.level - level, 0)
+            world.alive &= world.level != 0
+            if t == T or not world.alive.any():
+                break
+            mask[t] = world.alive
+            obs[t] = coord_array
+            mean = self.model(torch.from_numpy(coord_array))
+            action = mean + cfg.sigma * torch.randn_like(mean)
+            actions[t] = action.numpy()
+            world._move_players(action.numpy().astype(np.float64), explore=False)
+
+        world.sync_players()
+        return {"obs": obs, "actions": actions, "rewards": rewards, "mask": mask, "players": players}
+
+    def advantages(self, rewards: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """Discounted returns minus the per-tick mean over live worlds, scaled to unit std."""
+        returns = np.zeros_like(rewards)
+        running = np.zeros(rewards.shape[1], dtype=np.float32)
+        for t in range(len(rewards) - 1, -1, -1):
+            running = rewards[t] + self.cfg.gamma * running * mask[t]
+            returns[t] = running
+        alive = mask.sum(axis=1, keepdims=True)
+        baseline = (returns * mask).sum(axis=1, keepdims=True) / np.maximum(alive, 1)
+        adv = (returns - baseline) * mask
+        std = adv[mask].std() if mask.any() else 0.0
+        return adv / (std + 1e-6)
+
+    def update(self, batch: dict) -> float:
+        """One policy-gradient step on a set of rollouts. Returns the loss."""
+        mask = batch["mask"]
+        adv = torch.from_numpy(self.advantages(batch["rewards"], mask)[mask])
+        obs = torch.from_numpy(batch["obs"][mask])
+        actions = torch.from_numpy(batch["actions"][mask])
+
+        mean = self.model(obs)
+        log_prob = -((actions - mean) ** 2).sum(dim=-1) / (2 * self.cfg.sigma ** 2)
+        loss = -(log_prob * adv).mean()
+
+        self.opt.zero_grad(set_to_none=True)
+        loss.backward()
+        torch.nn.utils.clip_grad_norm_(self.model.parameters(), 1.0)
+        self.opt.step()
+        return loss.item()
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        torch.save(self.model.state_dict(), tmp_path)
+        os.replace(tmp_path, path)
+
+    def train(self) -> list:
+        """Run cfg.iterations rollout/update rounds, checkpointing as configured. Returns per-iteration stats."""
+        cfg = self.cfg
+        np.random.seed(cfg.seed)
+        torch.manual_seed(cfg.seed)
+        history = []
+        for i in range(cfg.iterations):
+            batch = self.collect()
+            loss = self.update(batch)
+            levels = np.array([p.level for p in batch["players"]])
+            stats = {
+                "iteration": i,
+                "return": float(batch["rewards"].sum(axis=0).mean()),
+                "final_level": float(levels.mean()),
+                "survival": float((levels > 0).mean()),
+                "steps": int(batch["mask"].sum()),
+                "loss": loss,
+            }
+            history.append(stats)
+            print(f"Iteration {i+1}/{cfg.iterations}: return {stats['return']:.2f}, "
+                  f"final level {stats['final_level']:.1f}, survival {stats['survival']:.2f}")
+            if cfg.checkpoint_path and ((i + 1) % cfg.checkpoint_every == 0 or i + 1 == cfg.iterations):
+                self.save(cfg.checkpoint_path)
+        return history
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Train the steering policy with batched REINFORCE.')
+    parser.add_argument('--iterations', type=int, default=ReinforceConfig.iterations)
+    parser.add_argument('--worlds', type=int, default=ReinforceConfig.n_worlds)
+    parser.add_argument('--ticks', type=int, default=ReinforceConfig.episode_ticks)
+    parser.add_argument('--k-nearest', type=int, default=ReinforceConfig.k_nearest)
+    parser.add_argument('--output', default=ReinforceConfig.checkpoint_path)
+    parser.add_argument('--seed', type=int, default=ReinforceConfig.seed)
+    args = parser.parse_args()
+
+    trainer = ReinforceTrainer(ReinforceConfig(
+        n_worlds=args.worlds, episode_ticks=args.ticks, iterations=args.iterations,
+        k_nearest=args.k_nearest, checkpoint_path=args.output, seed=args.seed,
+    ))
+    trainer.train()
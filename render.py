@@ -0,0 +1,286 @@
+# render.py
+import os
+import queue
+import sys
+import threading
+from collections import namedtuple
+from multiprocessing import get_context
+
+import numpy as np
+import pygame
+
+from model import EntityStore
+from recording import read_episode
+
+# One frame of the world as circles in drawing order (player, particles, killers):
+# centres (N, 2) int32, colours (N, 3) uint8, radii and line widths (N,) int32
+Frame = namedtuple('Frame', 'tick xy rgb radius width')
+
+
+def _frozen(array, dtype):
+    array = np.array(array, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+def take_snapshot(app):
+    '''Copy what ``App._render_graphics`` would draw right now into a read-only Frame.'''
+    player, particles, killers = app.player, app.particles, app.killers
+    if isinstance(particles, EntityStore) and isinstance(killers, EntityStore):
+        x = np.concatenate(([player.x], particles.x, killers.x))
+        y = np.concatenate(([player.y], particles.y, killers.y))
+        rgb = np.concatenate((
+            [(player.R, player.G, player.B)],
+            np.stack((particles.R, particles.G, particles.B), axis=1),
+            np.stack((killers.R, killers.G, killers.B), axis=1),
+        ))
+        radius = np.concatenate(([player.size], particles.size, killers.size))
+        width = np.concatenate(([player.fill], particles.fill, killers.fill))
+    else:
+        entities = [player] + list(particles) + list(killers)
+        x = [obj.x for obj in entities]
+        y = [obj.y for obj in entities]
+        rgb = [(obj.R, obj.G, obj.B) for obj in entities]
+        # Particles are drawn as radius 4, width 3 circles
+        radius = [player.size] + [4] * len(particles) + [obj.size for obj in killers]
+        width = [player.fill] + [3] * len(particles) + [obj.fill for obj in killers]
+    xy = np.stack((np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)), axis=1).astype(np.int32)
+    xy.flags.writeable = False
+    return Frame(app.round_count, xy, _frozen(rgb, np.uint8), _frozen(radius, np.int32), _frozen(width, np.int32))
+
+
+def episode_frames(path, every=1):
+    '''Frames of a recording.EpisodeRecorder file, one per ``every`` ticks.'''
+    header, records = read_episode(path)
+    n_particles = header['n_particles']
+    particle_rgb = np.array(header['particle_rgb'], dtype=np.uint8).reshape(-1, 3)
+    killer_rgb = np.array(header['killer_rgb'], dtype=np.uint8).reshape(-1, 3)
+    for row in records[::every]:
+        xy = np.concatenate(([row['player']], row['particles'], row['killers'])).astype(np.int32)
+        rgb = np.concatenate(([row['rgb']], particle_rgb, killer_rgb))
+        radius = np.concatenate(([row['size']], np.full(n_particles, 4), header['killer_size']))
+        width = np.concatenate(([row['fill']], np.full(n_particles, 3), header['killer_fill']))
+        yield Frame(int(row['tick']), xy, _frozen(rgb, np.uint8), _frozen(radius, np.int32), _frozen(width, np.int32))
+
+
+def draw_frame(surface, frame):
+    surface.fill((0, 0, 0))
+    for (x, y), rgb, radius, width in zip(frame.xy.tolist(), frame.rgb.tolist(), frame.radius.tolist(),
+                                          frame.width.tolist()):
+        pygame.draw.circle(surface, rgb, (x, y), radius, width)
+
+
+class ArraySink:
+    '''Keeps every frame in ``frames`` as a (height, width, 3) uint8 array; needs no display.'''
+    def __init__(self, window_dim):
+        self.surface = pygame.Surface(window_dim)
+        self.frames = []
+
+    def __call__(self, frame):
+        draw_frame(self.surface, frame)
+        self.frames.append(pygame.surfarray.array3d(self.surface).swapaxes(0, 1))
+
+
+class ImageSink:
+    '''Writes every frame to ``directory/frame_<tick>.png``; needs no display.'''
+    def __init__(self, directory, window_dim):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.window_dim = tuple(window_dim)
+        # Created on first use so the sink can be pickled into a RenderProcess
+        self._surface = None
+
+    def __call__(self, frame):
+        if self._surface is None:
+            self._surface = pygame.Surface(self.window_dim)
+        draw_frame(self._surface, frame)
+        pygame.image.save(self._surface, os.path.join(self.directory, f'frame_{frame.tick:06d}.png'))
+
+
+class DirtyRectSink:
+    '''Draws Frames on the display from cached sprites, repainting only what changed.
+
+    An entity whose position, colour, radius or width differs from the
+    previous frame gets its old and new rectangles repainted: each region is
+    cleared and every sprite overlapping it is blitted again in drawing order
+    (clipped to the region, so overlaps come out as in a full redraw), and
+    only those regions are pushed with ``display.update``. The first frame
+    and frames where more than ``max_dirty`` entities changed are drawn in
+    full with a single ``blits`` call, which beats many clipped repaints.
+    Calling it touches the display, so call it on the thread that opened
+    the window, never from a RenderThread.
+    '''
+    def __init__(self, max_dirty=32):
+        self.max_dirty = max_dirty
+        self._sprites = {}
+        self._previous = None
+        self._entity_sprites = []
+
+    def _sprite(self, surface, rgb, radius, width):
+        key = (rgb, radius, width)
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            # A circle covers x - r .. x + r - 1, so a 2r square sprite matches draw.circle pixel for pixel;
+            # colour-keyed sprites in the target's pixel format blit about twice as fast as per-pixel alpha
+            sprite = pygame.Surface((2 * radius, 2 * radius), 0, surface)
+            colorkey = (255, 255, 255) if rgb == (0, 0, 0) else (0, 0, 0)
+            sprite.fill(colorkey)
+            sprite.set_colorkey(colorkey)
+            pygame.draw.circle(sprite, rgb, (radius, radius), radius, width)
+            self._sprites[key] = sprite
+        return sprite
+
+    def _update_sprites(self, surface, frame, changed):
+        looks = zip(changed.tolist(), frame.rgb[changed].tolist(), frame.radius[changed].tolist(),
+                    frame.width[changed].tolist())
+        for i, rgb, radius, width in looks:
+            self._entity_sprites[i] = self._sprite(surface, tuple(rgb), radius, width)
+
+    def draw(self, surface, frame):
+        '''Bring ``surface`` up to ``frame``; returns the repainted rectangles, or None after a full redraw.'''
+        previous = self._previous
+        self._previous = frame
+        corner = frame.xy - frame.radius[:, None]
+        if previous is None or len(previous.xy) != len(frame.xy):
+            self._entity_sprites = [None] * len(frame.xy)
+            self._update_sprites(surface, frame, np.arange(len(frame.xy)))
+            changed = None
+        else:
+            looks = ((frame.rgb != previous.rgb).any(axis=1) | (frame.radius != previous.radius)
+                     | (frame.width != previous.width))
+            self._update_sprites(surface, frame, np.flatnonzero(looks))
+            changed = np.flatnonzero(looks | (frame.xy != previous.xy).any(axis=1))
+            if len(changed) > self.max_dirty:
+                changed = None
+
+        if changed is None:
+            # Stream (sprite, position) pairs: materialising thousands of tuples at once keeps tripping
+            # full garbage collections of everything torch has allocated
+            surface.fill((0, 0, 0))
+            positions = zip(corner[:, 0].tolist(), corner[:, 1].tolist())
+            surface.blits(zip(self._entity_sprites, positions), doreturn=False)
+            return None
+
+        size = 2 * frame.radius
+        old_corner = previous.xy - previous.radius[:, None]
+        old_size = 2 * previous.radius
+        rects = []
+        for i in changed.tolist():
+            new = pygame.Rect(*corner[i].tolist(), size[i], size[i])
+            old = pygame.Rect(*old_corner[i].tolist(), old_size[i], old_size[i])
+            rects.extend((new.union(old),) if new.colliderect(old) else (new, old))
+        rects = [rect.clip(surface.get_rect()) for rect in rects]
+        rects = [rect for rect in rects if rect.w and rect.h]
+
+        x0, y0 = corner[:, 0], corner[:, 1]
+        x1, y1 = x0 + size, y0 + size
+        for rect in rects:
+            hit = np.flatnonzero((x0 < rect.right) & (x1 > rect.left) & (y0 < rect.bottom) & (y1 > rect.top))
+            surface.set_clip(rect)
+            surface.fill((0, 0, 0))
+            surface.blits([(self._entity_sprites[i], corner[i].tolist()) for i in hit.tolist()], doreturn=False)
+        surface.set_clip(None)
+        return rects
+
+    def __call__(self, frame):
+        surface = pygame.display.get_surface()
+        if surface is None:
+            return
+        rects = self.draw(surface, frame)
+        if rects is None:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+
+
+def _consume(frames, sink, results):
+    drawn, error = 0, None
+    while True:
+        frame = frames.get()
+        if frame is None:
+            break
+        if error is not None:
+            continue
+        try:
+            sink(frame)
+            drawn += 1
+        except Exception as e:
+            error = e
+    results.put((drawn, error))
+
+
+class RenderThread:
+    '''Feeds frames to a sink on a background thread through a bounded queue.
+
+    With ``drop_stale`` a full queue never blocks ``submit``: the oldest
+    waiting frame is thrown away (counted in ``dropped``), so a slow display
+    only costs frames, not simulation speed. Without it ``submit`` waits, so
+    capture sinks get every frame. Headless Apps submit one frame every
+    ``every`` ticks. ``close`` sets ``drawn`` and re-raises sink errors.
+
+    Only offscreen sinks (ImageSink, ArraySink) belong here: SDL wants
+    display and event calls on the thread that created the window, so
+    rendered rounds draw on the main thread.
+    '''
+    def __init__(self, sink, maxsize=2, drop_stale=True, every=1):
+        self.drop_stale = drop_stale
+        self.every = every
+        self.drawn = 0
+        self.dropped = 0
+        self._start(sink, maxsize)
+
+    def _start(self, sink, maxsize):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._results = queue.Queue()
+        self._worker = threading.Thread(target=_consume, args=(self._queue, sink, self._results), daemon=True)
+        self._worker.start()
+
+    def submit(self, frame):
+        if not self.drop_stale:
+            self._queue.put(frame)
+            return
+        while True:
+            try:
+                self._queue.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self):
+        '''Draw what is still queued and stop the consumer.'''
+        self._queue.put(None)
+        self.drawn, error = self._results.get()
+        self._worker.join()
+        if error is not None:
+            raise error
+
+
+class RenderProcess(RenderThread):
+    '''RenderThread whose sink runs in a spawned process, so drawing doesn't hold this process's GIL.
+
+    The sink is pickled into the process and must write its frames out
+    itself (ImageSink); frames are pickled on the way. Needs the usual
+    ``if __name__ == '__main__'`` guard and can't be started from a daemonic
+    worker process.
+    '''
+    def _start(self, sink, maxsize):
+        ctx = get_context('spawn')
+        self._queue = ctx.Queue(maxsize=maxsize)
+        self._results = ctx.Queue()
+        self._worker = ctx.Process(target=_consume, args=(self._queue, sink, self._results), daemon=True)
+        self._worker.start()
+
+
+if __name__ == "__main__":
+    # Render a recorded episode to PNG frames, no display needed:
+    # python render.py episode.bin frames_dir [every]
+    header, _ = read_episode(sys.argv[1])
+    renderer = RenderProcess(ImageSink(sys.argv[2], tuple(header['window_dim'])), drop_stale=False)
+    for frame in episode_frames(sys.argv[1], every=int(sys.argv[3]) if len(sys.argv) > 3 else 1):
+        renderer.submit(frame)
+    renderer.close()
+    print(f'{renderer.drawn} frames written to {sys.argv[2]}')
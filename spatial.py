@@ -0,0 +1,94 @@
+# spatial.py
+import math
+
+
+class SpatialHash:
+    '''Uniform grid over the toroidal game window.
+
+    Objects with ``x``/``y`` attributes are bucketed by cell. Lookups around a
+    point only visit the cells within the query radius, wrapping across the
+    window edges the same way the player does.
+    '''
+    def __init__(self, window_dim, cell_size=25):
+        self.windowWidth, self.windowHeight = window_dim
+        self.cols = max(1, int(self.windowWidth // cell_size))
+        self.rows = max(1, int(self.windowHeight // cell_size))
+        self.cell_w = self.windowWidth / self.cols
+        self.cell_h = self.windowHeight / self.rows
+        self.cells = [set() for _ in range(self.cols * self.rows)]
+        self._cell_of = {}
+
+    def __len__(self):
+        return len(self._cell_of)
+
+    def _cell(self, x, y):
+        cx = int(x // self.cell_w) % self.cols
+        cy = int(y // self.cell_h) % self.rows
+        return cy * self.cols + cx
+
+    def insert(self, obj):
+        cell = self._cell(obj.x, obj.y)
+        self.cells[cell].add(obj)
+        self._cell_of[obj] = cell
+        obj.grid = self
+
+    def remove(self, obj):
+        self.cells[self._cell_of.pop(obj)].discard(obj)
+        obj.grid = None
+
+    def move(self, obj):
+        '''Re-bucket ``obj`` after its position changed.'''
+        cell = self._cell(obj.x, obj.y)
+        old = self._cell_of[obj]
+        if cell != old:
+            self.cells[old].discard(obj)
+            self.cells[cell].add(obj)
+            self._cell_of[obj] = cell
+
+    def candidates(self, x, y, radius):
+        '''Objects in every cell that overlaps the circle, edges wrapped.'''
+        rx = min(int(math.ceil(radius / self.cell_w)), self.cols // 2)
+        ry = min(int(math.ceil(radius / self.cell_h)), self.rows // 2)
+        cx = int(x // self.cell_w)
+        cy = int(y // self.cell_h)
+        cells = {
+            (j % self.rows) * self.cols + (i % self.cols)
+            for i in range(cx - rx, cx + rx + 1)
+            for j in range(cy - ry, cy + ry + 1)
+        }
+        found = []
+        for cell in cells:
+            found.extend(self.cells[cell])
+        return found
+
+    def query_radius(self, x, y, radius):
+        '''Objects within ``radius`` of (x, y), measured across the wrapped edges.'''
+        found = []
+        for obj in self.candidates(x, y, radius):
+            dx = abs(obj.x - x) % self.windowWidth
+            dy = abs(obj.y - y) % self.windowHeight
+            dx = min(dx, self.windowWidth - dx)
+            dy = min(dy, self.windowHeight - dy)
+            if math.hypot(dx, dy) < radius:
+                found.append(obj)
+        return found
+
+    def nearest(self, x, y, k):
+        '''Up to ``k`` objects closest to (x, y) as ``(distance, obj)`` pairs, nearest first.'''
+        if k <= 0 or not self._cell_of:
+            return []
+        radius = max(self.cell_w, self.cell_h)
+        max_radius = math.hypot(self.windowWidth, self.windowHeight) / 2
+        while True:
+            found = []
+            for obj in self.candidates(x, y, radius):
+                dx = abs(obj.x - x) % self.windowWidth
+                dy = abs(obj.y - y) % self.windowHeight
+                d = math.hypot(min(dx, self.windowWidth - dx), min(dy, self.windowHeight - dy))
+                if d <= radius:
+                    found.append((d, obj))
+            # Everything within radius has been seen, so the k closest of those are final
+            if len(found) >= k or radius >= max_radius:
+                found.sort(key=lambda pair: pair[0])
+                return found[:k]
+            radius *= 2
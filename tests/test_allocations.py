@@ -0,0 +1,23 @@
+# test_allocations.py
+import pytest
+
+import benchmark
+from view import App
+
+
+def test_steady_state_ticks_stay_within_the_allocation_bounds():
+    results = benchmark.check_tick_allocations(n_ticks=100, warmup=100)
+    assert results['tick_alloc_bytes[train]'] <= benchmark.TICK_ALLOC_BOUNDS['train']
+
+
+def test_an_extra_array_per_tick_fails_the_check(monkeypatch):
+    update = App._update_npc_positions
+
+    def update_with_copy(self):
+        coord_array, y_target = update(self)
+        # The kind of regression the check is for: a fresh observation array every tick instead of the reused buffer
+        return coord_array.copy(), y_target
+
+    monkeypatch.setattr(App, '_update_npc_positions', update_with_copy)
+    with pytest.raises(AssertionError, match='bytes allocated per tick'):
+        benchmark.check_tick_allocations(n_ticks=100, warmup=100)
@@ -0,0 +1,59 @@
+# test_checkpoint.py
+import os
+import time
+
+import pytest
+
+import checkpoint
+from checkpoint import CheckpointWriter, load_latest_checkpoint
+from model import Player
+from network import Network
+
+
+def make_players(n=3):
+    return [Player((600, 600), Network([4, 3, 2]), True) for _ in range(n)]
+
+
+def wait_for_error(writer, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while writer.error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.error is not None
+
+
+def test_checkpoints_round_trip(tmp_path):
+    players = make_players()
+    writer = CheckpointWriter(str(tmp_path))
+    writer.submit(0, players)
+    writer.submit(1, players)
+    writer.close()
+    loaded = load_latest_checkpoint(str(tmp_path))
+    assert loaded['generation'] == 1
+    assert len(loaded['networks']) == len(players)
+
+
+def disk_full(*args, **kwargs):
+    raise OSError(28, 'No space left on device')
+
+
+def test_failed_write_is_raised_and_never_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint.np, 'savez', disk_full)
+    players = make_players()
+    writer = CheckpointWriter(str(tmp_path))
+    writer.submit(0, players)
+    wait_for_error(writer)
+    assert os.listdir(tmp_path) == []
+    # More generations than the queue holds: each submit raises instead of waiting on a dead writer
+    for generation in range(1, 5):
+        with pytest.raises(OSError):
+            writer.submit(generation, players)
+    writer.close()
+
+
+def test_close_raises_a_write_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint.np, 'savez', disk_full)
+    writer = CheckpointWriter(str(tmp_path))
+    writer.submit(0, make_players())
+    with pytest.raises(OSError):
+        writer.close()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,71 @@
+# test_fitness_cache.py
+import random
+
+import numpy as np
+import pytest
+import torch
+
+import dashboard
+from dashboard import Config, Player, create_children, get_player, run_evolution, run_simulation_batch
+from fitness_cache import FitnessCache, network_fingerprint
+
+
+def seeded_conf(**settings):
+    random.seed(0)
+    np.random.seed(0)
+    torch.manual_seed(0)
+    conf = Config()
+    conf.round_limit = 300
+    conf.seeded_rounds = 'fixed'
+    for name, value in settings.items():
+        setattr(conf, name, value)
+    return conf
+
+
+@pytest.mark.parametrize('learning_mode', ['online', 'replay'])
+def test_identical_siblings_are_played_once(learning_mode):
+    conf = seeded_conf(learning_mode=learning_mode)
+    player = get_player(conf)
+    twin = Player(conf.window_dim, player.network.copy(), conf.use_network)
+    cache = FitnessCache()
+    survivors = run_simulation_batch([player, twin], 0, conf, fitness_cache=cache)
+    assert cache.hits == 1
+    assert twin.level_data == player.level_data and twin.level == player.level
+    # Both survive a cutoff of 0, so the twin gets the trained network state too
+    assert survivors == [player, twin]
+    assert network_fingerprint(twin.network) == network_fingerprint(player.network)
+
+
+def test_sparse_siblings_hit_without_building_networks_for_the_key():
+    conf = seeded_conf(sparse_children=True)
+    parent = get_player(conf)
+    sibling = create_children([parent], conf, 1)[0]
+    twin = Player(conf.window_dim, None, conf.use_network, genome=sibling.genome)
+    cache = FitnessCache()
+    run_simulation_batch([sibling, twin], 0, conf, fitness_cache=cache)
+    assert cache.hits == 1
+    assert twin.level_data == sibling.level_data
+
+
+def test_run_evolution_clears_the_cache_every_generation(monkeypatch):
+    caches = []
+
+    def recording_cache():
+        cache = FitnessCache()
+        caches.append(cache)
+        return cache
+
+    monkeypatch.setattr(dashboard, 'FitnessCache', recording_cache)
+    lengths = []
+    clear = FitnessCache.clear
+
+    def recording_clear(self):
+        lengths.append(len(self))
+        clear(self)
+
+    monkeypatch.setattr(FitnessCache, 'clear', recording_clear)
+    conf = seeded_conf()
+    run_evolution(4, 2, 0, conf)
+    assert len(caches) == 1
+    assert lengths and all(n > 0 for n in lengths)
+    assert len(caches[0]) == 0
@@ -1,8 +1,9 @@
 # torch_network.py
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Optional, Tuple
+import warnings
+from dataclasses import dataclass, replace
+from typing import List, Optional, Tuple
 
 import numpy as np
 import torch
@@ -17,6 +18,106 @@ class TorchNetConfig:
     hidden2: int = 32
     lr: float = 1e-3
     device: Optional[str] = "cpu"
+    # "online": one Adam step per train_step call
+    # "replay": store samples in a ring buffer and train on a minibatch every `update_every` calls
+    learning_mode: str = "online"
+    buffer_size: int = 4096
+    batch_size: int = 64
+    update_every: int = 16
+    # Run the whole train step (forward, backward, clipping, Adam) as one compiled
+    # function: torch.compile, else TorchScript, else the eager step
+    compile: bool = False
+
+
+def _fused_train_step(x: torch.Tensor, y: torch.Tensor, params: List[torch.Tensor], exp_avgs: List[torch.Tensor],
+                      exp_avg_sqs: List[torch.Tensor], steps: List[torch.Tensor], lr: float, beta1: float,
+                      beta2: float, eps: float, max_norm: float) -> torch.Tensor:
+    """
+    TorchSteeringNet's train step with the gradients written out by hand, so it
+    compiles to a single graph: unit-vector MSE, backprop through the _MLP,
+    clip_grad_norm_ and an Adam update in place on params and optimizer state.
+    """
+    w1, b1, w2, b2, w3, b3 = params[0], params[1], params[2], params[3], params[4], params[5]
+    z1 = torch.addmm(b1, x, w1.t())
+    h1 = torch.relu(z1)
+    z2 = torch.addmm(b2, h1, w2.t())
+    h2 = torch.relu(z2)
+    pred = torch.tanh(torch.addmm(b3, h2, w3.t()))
+
+    # d mse(pred / |pred|, y / |y|) / d pred, with the same 1e-6 clamps as the eager loss
+    pred_norm = pred.norm(p=2, dim=-1, keepdim=True)
+    pred_unit = pred / torch.clamp(pred_norm, min=1e-6)
+    y_unit = y / torch.clamp(y.norm(p=2, dim=-1, keepdim=True), min=1e-6)
+    g = (pred_unit - y_unit) * (2.0 / pred_unit.numel())
+    d_pred = torch.where(
+        pred_norm > 1e-6,
+        (g - pred_unit * (pred_unit * g).sum(-1, keepdim=True)) / torch.clamp(pred_norm, min=1e-6),
+        g / 1e-6,
+    )
+
+    dz3 = d_pred * (1 - pred * pred)
+    dz2 = dz3.mm(w3) * (z2 > 0)
+    dz1 = dz2.mm(w2) * (z1 > 0)
+    grads = [dz1.t().mm(x), dz1.sum(0), dz2.t().mm(h1), dz2.sum(0), dz3.t().mm(h2), dz3.sum(0)]
+
+    total_norm = torch.stack([gr.pow(2).sum() for gr in grads]).sum().sqrt()
+    clip = torch.clamp(max_norm / (total_norm + 1e-6), max=1.0)
+    for step in steps:
+        step.add_(1)
+    bias_correction1 = 1 - beta1 ** steps[0]
+    bias_correction2_sqrt = (1 - beta2 ** steps[0]).sqrt()
+    for i in range(6):
+        gr = grads[i] * clip
+        exp_avgs[i].mul_(beta1).add_(gr, alpha=1 - beta1)
+        exp_avg_sqs[i].mul_(beta2).addcmul_(gr, gr, value=1 - beta2)
+        denom = exp_avg_sqs[i].sqrt() / bias_correction2_sqrt + eps
+        params[i].sub_(lr / bias_correction1 * exp_avgs[i] / denom)
+    return pred
+
+
+_compiled_steps = None
+
+
+def _compiled_train_steps() -> list:
+    """Compiled variants of _fused_train_step, best first, shared by every net."""
+    global _compiled_steps
+    if _compiled_steps is None:
+        _compiled_steps = []
+        if hasattr(torch, "compile"):
+            _compiled_steps.append(("torch.compile", torch.compile(_fused_train_step)))
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", FutureWarning)
+                _compiled_steps.append(("torchscript", torch.jit.script(_fused_train_step)))
+        except Exception as e:
+            warnings.warn(f"TorchScript unavailable for the train step: {e}")
+    return _compiled_steps
+
+
+class ReplayBuffer:
+    """
+    Preallocated ring buffer of (observation, target) pairs.
+    Once full, the oldest samples are overwritten.
+    """
+    def __init__(self, size: int, input_dim: int, device: torch.device):
+        self.size = size
+        self.x = torch.zeros(size, input_dim, device=device)
+        self.y = torch.zeros(size, 2, device=device)
+        self.pos = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def push(self, x: torch.Tensor, y: torch.Tensor) -> None:
+        self.x[self.pos] = x
+        self.y[self.pos] = y
+        self.pos = (self.pos + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def sample(self, batch_size: int, generator: Optional[torch.Generator] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        idx = torch.randint(0, self.count, (batch_size,), device=self.x.device, generator=generator)
+        return self.x[idx], self.y[idx]
 
 
 class _MLP(nn.Module):
@@ -48,11 +149,67 @@ class TorchSteeringNet:
       - .save(path), .load(path)
 
     Expects x_np shape (input_dim, 1), y_np shape (2, 1).
+
+    For a per-tick caller there is also a zero-copy path: write the
+    observation into .obs and the target into .target, then call
+    .train_step_io() / .predict_io(), which write the prediction into .action.
+    The arrays and the tensors viewing them are allocated once.
     """
     def __init__(self, cfg: TorchNetConfig):
+        self.cfg = cfg
         self.device = torch.device(cfg.device if cfg.device else ("mps" if torch.backends.mps.is_available() else "cpu"))
         self.model = _MLP(cfg.input_dim, cfg.hidden1, cfg.hidden2).to(self.device)
         self.opt = torch.optim.Adam(self.model.parameters(), lr=cfg.lr)
+        if cfg.learning_mode not in ("online", "replay"):
+            raise ValueError(f"Unknown learning_mode: {cfg.learning_mode}")
+        self.buffer = None
+        self.steps = 0
+        if cfg.learning_mode == "replay":
+            self.buffer = ReplayBuffer(cfg.buffer_size, cfg.input_dim, self.device)
+        # Generator for replay sampling, see seed_sampling (None draws from torch's global stream)
+        self.sample_generator = None
+        self._train_steps = list(_compiled_train_steps()) if cfg.compile else []
+        self.obs = np.zeros(cfg.input_dim, dtype=np.float32)
+        self.target = np.zeros(2, dtype=np.float32)
+        self.action = np.zeros(2, dtype=np.float32)
+        self._bind_io()
+
+    def _bind_io(self) -> None:
+        """Tensor views of obs/target/action, plus device-side copies off the CPU."""
+        self._obs_t = torch.from_numpy(self.obs).unsqueeze(0)        # [1, D]
+        self._target_t = torch.from_numpy(self.target).unsqueeze(0)  # [1, 2]
+        self._action_t = torch.from_numpy(self.action)               # [2]
+        self._obs_dev = self._target_dev = None
+        if self.device.type != "cpu":
+            self._obs_dev = self._obs_t.to(self.device)
+            self._target_dev = self._target_t.to(self.device)
+
+    def __getstate__(self) -> dict:
+        # The views would be copied apart from the arrays they share memory with,
+        # and compiled train steps can't be copied at all
+        state = self.__dict__.copy()
+        for key in ("_obs_t", "_target_t", "_action_t", "_obs_dev", "_target_dev", "_train_steps"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._train_steps = list(_compiled_train_steps()) if self.cfg.compile else []
+        self._bind_io()
+
+    def seed_sampling(self, seed: Optional[int]) -> None:
+        """Draw replay minibatches from a generator of our own seeded with `seed` (None: torch's global stream)."""
+        self.sample_generator = None
+        if seed is not None:
+            self.sample_generator = torch.Generator(device=self.device)
+            self.sample_generator.manual_seed(seed)
+
+    def _io_tensors(self) -> Tuple[torch.Tensor, torch.Tensor]:
+        if self._obs_dev is None:
+            return self._obs_t, self._target_t
+        self._obs_dev.copy_(self._obs_t)
+        self._target_dev.copy_(self._target_t)
+        return self._obs_dev, self._target_dev
 
     def _to_tensor(self, arr: np.ndarray) -> torch.Tensor:
         if arr.ndim == 2 and arr.shape[1] == 1:
@@ -66,16 +223,14 @@ class TorchSteeringNet:
         y = self.model(x)                       # [1, 2]
         return y.squeeze(0).detach().cpu().numpy()
 
-    def train_step(self, x_np: np.ndarray, y_np: np.ndarray) -> np.ndarray:
-        """
-        One online SGD step with MSE loss.
-        Returns the raw prediction (np.array of shape (2,)).
-        """
+    def _update(self, x: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+        """MSE between unit prediction and unit target, then one clipped Adam step."""
+        if self._train_steps:
+            pred = self._compiled_update(x, y)
+            if pred is not None:
+                return pred
         self.model.train()
-        x = self._to_tensor(x_np).unsqueeze(0)  # [1, D]
-        y = self._to_tensor(y_np).unsqueeze(0)  # [1, 2]
-
-        pred = self.model(x)                    # [1, 2]
+        pred = self.model(x)                    # [B, 2]
 
         # Normalize BOTH target and prediction to unit vectors for stability
         pred_norm = torch.clamp(pred.norm(p=2, dim=-1, keepdim=True), min=1e-6)
@@ -90,7 +245,74 @@ class TorchSteeringNet:
         torch.nn.utils.clip_grad_norm_(self.model.parameters(), 1.0)
         self.opt.step()
 
-        return pred.detach().squeeze(0).cpu().numpy()
+        return pred
+
+    @torch.no_grad()
+    def _compiled_update(self, x: torch.Tensor, y: torch.Tensor) -> Optional[torch.Tensor]:
+        """
+        _update through the first compiled train step that works. The Adam state
+        lives in self.opt.state in torch's own layout, so the eager step,
+        copy() and TorchSteeringPopulation can pick it up. Returns None once no
+        compiled variant is left, and _update falls back to eager mode.
+        """
+        params = [p.data for p in self.model.parameters()]
+        states = []
+        for p in self.model.parameters():
+            state = self.opt.state[p]
+            if not state:
+                state.update(step=torch.tensor(0.0), exp_avg=torch.zeros_like(p.data), exp_avg_sq=torch.zeros_like(p.data))
+            states.append(state)
+        group = self.opt.param_groups[0]
+        beta1, beta2 = group["betas"]
+        args = (
+            x, y, params,
+            [s["exp_avg"] for s in states], [s["exp_avg_sq"] for s in states], [s["step"] for s in states],
+            float(group["lr"]), float(beta1), float(beta2), float(group["eps"]), 1.0,
+        )
+        while self._train_steps:
+            name, step_fn = self._train_steps[0]
+            try:
+                return step_fn(*args)
+            except Exception as e:
+                # Compilation happens on the first call, before anything is updated
+                warnings.warn(f"{name} train step failed, falling back: {e}")
+                self._train_steps.pop(0)
+        return None
+
+    def train_step(self, x_np: np.ndarray, y_np: np.ndarray) -> np.ndarray:
+        """
+        One online SGD step with MSE loss, or in replay mode: store the sample,
+        train on a replay minibatch every `update_every` calls and act with predict.
+        Returns the raw prediction (np.array of shape (2,)).
+        """
+        x = self._to_tensor(x_np).unsqueeze(0)  # [1, D]
+        y = self._to_tensor(y_np).unsqueeze(0)  # [1, 2]
+        return self._train(x, y).detach().squeeze(0).cpu().numpy()
+
+    def _train(self, x: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+        if self.buffer is None:
+            return self._update(x, y)
+
+        self.buffer.push(x[0], y[0])
+        self.steps += 1
+        if self.steps % self.cfg.update_every == 0 and len(self.buffer) >= self.cfg.batch_size:
+            self._update(*self.buffer.sample(self.cfg.batch_size, self.sample_generator))
+        with torch.no_grad():
+            return self.model(x)
+
+    def train_step_io(self) -> np.ndarray:
+        """train_step on .obs and .target, the prediction is written into .action and returned."""
+        pred = self._train(*self._io_tensors())
+        with torch.no_grad():
+            self._action_t.copy_(pred[0])
+        return self.action
+
+    @torch.no_grad()
+    def predict_io(self) -> np.ndarray:
+        """predict on .obs, the prediction is written into .action and returned."""
+        x, _ = self._io_tensors()
+        self._action_t.copy_(self.model(x)[0])
+        return self.action
 
     def save(self, path: str) -> None:
         torch.save(self.model.state_dict(), path)
@@ -99,6 +321,26 @@ class TorchSteeringNet:
         sd = torch.load(path, map_location=self.device)
         self.model.load_state_dict(sd)
 
+    def parameter_arrays(self) -> list:
+        """Model parameters as numpy arrays, in the order used by bind_parameters."""
+        return [p.detach().cpu().numpy() for p in self.model.parameters()]
+
+    def parameter_shapes(self) -> list:
+        """Shapes of the model parameters in the order used by bind_parameters."""
+        return [tuple(p.shape) for p in self.model.parameters()]
+
+    def bind_parameters(self, arrays) -> None:
+        """
+        Make the model parameters share memory with the float32 numpy `arrays`
+        (ordered as in parameter_shapes). Training and mutation then write
+        straight into them. CPU only.
+        """
+        if self.device.type != "cpu":
+            raise ValueError("bind_parameters needs the network on the CPU")
+        with torch.no_grad():
+            for param, arr in zip(self.model.parameters(), arrays):
+                param.data = torch.from_numpy(arr)
+
     def mutate(self, mutation_rate: float = 0.1) -> None:
         """
         In-place random mutation of weights.
@@ -115,12 +357,172 @@ class TorchSteeringNet:
         """
         Create a deep copy of this network.
         """
-        new_net = TorchSteeringNet(TorchNetConfig(
+        new_net = TorchSteeringNet(replace(
+            self.cfg,
             input_dim=self.model.fc1.in_features,
             hidden1=self.model.fc1.out_features,
             hidden2=self.model.fc2.out_features,
             lr=self.opt.param_groups[0]['lr'],
-            device=str(self.device)
+            device=str(self.device),
         ))
         new_net.model.load_state_dict(self.model.state_dict())
         return new_net
+
+
+class _MLPBucket:
+    """
+    Same-shaped _MLPs stacked into batched tensors of shape [M, ...].
+    Forward/backward for all members is one batched matmul per layer, and
+    Adam runs over the stacked tensors with per-member step counts, moments
+    and learning rates, so every member still follows its own optimizer.
+    """
+    def __init__(self, nets):
+        self.nets = nets
+        self.device = nets[0].device
+        group = nets[0].opt.param_groups[0]
+        self.beta1, self.beta2 = group['betas']
+        self.eps = group['eps']
+        self.lr = torch.tensor([n.opt.param_groups[0]['lr'] for n in nets], device=self.device)
+
+        member_params = [list(n.model.parameters()) for n in nets]
+        self.params = [
+            torch.stack([p[k].detach() for p in member_params]).clone().requires_grad_()
+            for k in range(len(member_params[0]))
+        ]
+        self.exp_avg = [torch.zeros_like(p) for p in self.params]
+        self.exp_avg_sq = [torch.zeros_like(p) for p in self.params]
+        self.step = torch.zeros(len(nets), device=self.device)
+        # Pick up optimizer state the members already have
+        for i, (net, params) in enumerate(zip(nets, member_params)):
+            for k, param in enumerate(params):
+                state = net.opt.state.get(param)
+                if state and 'exp_avg' in state:
+                    self.exp_avg[k][i] = state['exp_avg']
+                    self.exp_avg_sq[k][i] = state['exp_avg_sq']
+                    self.step[i] = float(state['step'])
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        w1, b1, w2, b2, w3, b3 = self.params
+        h = F.relu(torch.baddbmm(b1.unsqueeze(1), x.unsqueeze(1), w1.transpose(1, 2)))
+        h = F.relu(torch.baddbmm(b2.unsqueeze(1), h, w2.transpose(1, 2)))
+        return torch.tanh(torch.baddbmm(b3.unsqueeze(1), h, w3.transpose(1, 2))).squeeze(1)
+
+    def train_step(self, x: torch.Tensor, y: torch.Tensor, active: torch.Tensor) -> torch.Tensor:
+        pred = self.forward(x)                  # [M, 2]
+
+        pred_norm = torch.clamp(pred.norm(p=2, dim=-1, keepdim=True), min=1e-6)
+        y_norm = torch.clamp(y.norm(p=2, dim=-1, keepdim=True), min=1e-6)
+        # Summing the per-member MSE keeps each member's gradient its own
+        loss = ((pred / pred_norm - y / y_norm) ** 2).mean(dim=1).sum()
+
+        for p in self.params:
+            p.grad = None
+        loss.backward()
+
+        with torch.no_grad():
+            grads = [p.grad for p in self.params]
+            total_norm = torch.sqrt(sum(g.pow(2).flatten(1).sum(1) for g in grads))
+            clip = torch.clamp(1.0 / (total_norm + 1e-6), max=1.0)
+
+            self.step += active
+            step = self.step.clamp(min=1)
+            step_size = self.lr / (1 - self.beta1 ** step)
+            bias_correction2_sqrt = torch.sqrt(1 - self.beta2 ** step)
+            for p, g, m, v in zip(self.params, grads, self.exp_avg, self.exp_avg_sq):
+                shape = (-1,) + (1,) * (p.dim() - 1)
+                a = active.view(shape)
+                g = g * clip.view(shape)
+                m.copy_(torch.where(a, m * self.beta1 + (1 - self.beta1) * g, m))
+                v.copy_(torch.where(a, v * self.beta2 + (1 - self.beta2) * g * g, v))
+                denom = v.sqrt() / bias_correction2_sqrt.view(shape) + self.eps
+                p.sub_(torch.where(a, step_size.view(shape) * m / denom, torch.zeros_like(p)))
+
+        return pred.detach()
+
+    @torch.no_grad()
+    def sync(self) -> None:
+        """Copy the stacked weights and Adam state back onto the member nets."""
+        for i, net in enumerate(self.nets):
+            for k, param in enumerate(net.model.parameters()):
+                param.copy_(self.params[k][i])
+                if self.step[i] > 0:
+                    net.opt.state[param] = {
+                        'step': torch.tensor(float(self.step[i])),
+                        'exp_avg': self.exp_avg[k][i].clone(),
+                        'exp_avg_sq': self.exp_avg_sq[k][i].clone(),
+                    }
+
+
+class TorchSteeringPopulation:
+    """
+    Runs predict/train_step for a whole population of TorchSteeringNets at once.
+
+    Members are grouped into buckets by layer sizes; each bucket is a single
+    batched forward/backward. Call .sync() to write the trained weights and
+    optimizer state back onto the individual nets.
+
+    Expects x_np shape (N, input_dim), y_np shape (N, 2). Only online learning
+    with the eager train step is batched, so nets configured for replay or
+    compile are rejected.
+    """
+    def __init__(self, nets):
+        for net in nets:
+            if net.cfg.learning_mode != "online" or net.cfg.compile:
+                raise ValueError("TorchSteeringPopulation only trains online and eager, not with replay or compile")
+        buckets = {}
+        for i, net in enumerate(nets):
+            m = net.model
+            key = (m.fc1.in_features, m.fc1.out_features, m.fc2.out_features, str(net.device))
+            buckets.setdefault(key, []).append(i)
+        self.n_members = len(nets)
+        self.buckets = [(np.array(idx), _MLPBucket([nets[i] for i in idx])) for idx in buckets.values()]
+
+    @staticmethod
+    def _to_tensor(arr: np.ndarray, bucket: _MLPBucket) -> torch.Tensor:
+        return torch.from_numpy(np.ascontiguousarray(arr, dtype=np.float32)).to(bucket.device)
+
+    @torch.no_grad()
+    def predict(self, x_np: np.ndarray) -> np.ndarray:
+        out = np.zeros((self.n_members, 2), dtype=np.float32)
+        for idx, bucket in self.buckets:
+            out[idx] = bucket.forward(self._to_tensor(x_np[idx], bucket)).cpu().numpy()
+        return out
+
+    def train_step(self, x_np: np.ndarray, y_np: np.ndarray, active: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        One online step for every member whose ``active`` flag is set.
+        Returns the raw predictions (np.array of shape (N, 2)).
+        """
+        if active is None:
+            active = np.ones(self.n_members, dtype=bool)
+        out = np.zeros((self.n_members, 2), dtype=np.float32)
+        for idx, bucket in self.buckets:
+            bucket_active = active[idx]
+            if not bucket_active.any():
+                continue
+            pred = bucket.train_step(
+                self._to_tensor(x_np[idx], bucket),
+                self._to_tensor(y_np[idx], bucket),
+                torch.from_numpy(bucket_active).to(bucket.device),
+            )
+            out[idx] = pred.cpu().numpy()
+        return out
+
+    def sync(self) -> None:
+        for _, bucket in self.buckets:
+            bucket.sync()
+
+
+def export_numpy_policy(source, path: str) -> None:
+    """
+    Freeze a trained policy for numpy_policy.NumpyPolicy.
+    `source` is a TorchSteeringNet, an _MLP or the path of a saved state_dict
+    (e.g. policy_reinforce.pt). Writes the float32 weights to an .npz file.
+    """
+    if isinstance(source, TorchSteeringNet):
+        state = source.model.state_dict()
+    elif isinstance(source, nn.Module):
+        state = source.state_dict()
+    else:
+        state = torch.load(source, map_location="cpu")
+    np.savez(path, **{k.replace(".", "_"): v.detach().cpu().numpy().astype(np.float32) for k, v in state.items()})
@@ -5,16 +5,22 @@ import math
 import numpy as np
 import time
 
+from model import EntityStore
+from spatial import SpatialHash
+from observation import KNearestEncoder
+from render import take_snapshot, DirtyRectSink
 from pygame.locals import K_RIGHT, K_LEFT, K_UP, K_DOWN, K_ESCAPE
 
 
-def coll(player, obj, windowWidth, windowHeight):
+def coll(player, obj, windowWidth, windowHeight, rng=rn):
     x, y = player.x, player.y
     dd = math.hypot(x - obj.x, y - obj.y)
     collided = dd < 25
     if collided:
-        obj.x = rn.randint(0, windowWidth)
-        obj.y = rn.randint(0, windowHeight)
+        obj.x = rng.randint(0, windowWidth)
+        obj.y = rng.randint(0, windowHeight)
+        if obj.grid is not None:
+            obj.grid.move(obj)
         player.level_up()
         return collided
     return collided
@@ -32,7 +38,9 @@ def fight(player, obj, windowWidth, windowHeight):
 
 class App():
     '''Class that runs the game'''
-    def __init__(self, player, particles, killers, window_dim, eta, time_sleep, round_limit=1000, render=True, old_network=False):
+    def __init__(self, player, particles, killers, window_dim, eta, *, tick_rate=60, round_limit=1000, render=True,
+                 old_network=False, spatial_grid=False, k_nearest=None, max_fps=60, recorder=None, profiler=None,
+                 train_network=True, rng=None, renderer=None, dirty_rects=False):
         self.windowWidth, self.windowHeight = window_dim
         self.player = player
         self.particles = particles
@@ -42,16 +50,75 @@ class App():
         self._image_surf = None
         self.n_cells = 1 + len(particles) + len (killers)
         self.eta = eta
-        self.time_sleep = time_sleep
+        # Simulation ticks per second while rendering, the same on any machine. None runs as fast as
+        # possible, for watching a network train; headless rounds always do
+        self.tick_rate = tick_rate
+        self.max_fps = max_fps
+        self._keys = None
+        # Optional recording.EpisodeRecorder, fed the state and action of every tick
+        self.recorder = recorder
+        self.action = (0.0, 0.0)
+        # Optional render.RenderThread for headless rounds: one snapshot every renderer.every ticks is
+        # drawn offscreen on its thread (rendered rounds draw on this thread, where the window lives)
+        self.renderer = renderer
+        # Draw inline from cached sprites, repainting only the entities that changed (render.DirtyRectSink)
+        self._dirty_sink = DirtyRectSink() if dirty_rects else None
+        # Optional profiling.PhaseProfiler, its timed wrappers replace the hot-path methods
+        self.profiler = profiler
+        if profiler is not None:
+            self._update_npc_positions = profiler.wrap('observations', self._update_npc_positions)
+            self._check_collisions = profiler.wrap('collisions', self._check_collisions, counters={
+                'particles_eaten': lambda result: len(result[0]),
+                'killers_hit': lambda result: len(result[1]),
+            })
+            self._run_network = profiler.wrap('network', self._run_network)
+            self._render_graphics = profiler.wrap('render', self._render_graphics)
+        # random.Random of a seeded round, for respawns and exploration noise (None uses the global state)
+        self.rng = rng
+        self._respawn_rng = rng if rng is not None else rn
         self.round_limit = round_limit
         self.round_count = 0
         self.render = render
         self._validate()
         self.old_network = old_network
+        # False runs the network inference-only: predict/feedforward, no training
+        self.train_network = train_network
+        self.particle_grid = None
+        self.killer_grid = None
+        # model.EntityStore particles and killers are handled as whole arrays, no grids needed
+        self._stores = isinstance(particles, EntityStore) and isinstance(killers, EntityStore)
+        # With k_nearest the network sees a fixed number of entities, found through the grids
+        self.encoder = None
+        if k_nearest is not None:
+            self.encoder = KNearestEncoder(window_dim, k_nearest)
+            spatial_grid = True
+        if spatial_grid and not self._stores:
+            self.particle_grid = SpatialHash(window_dim)
+            self.killer_grid = SpatialHash(window_dim)
+            for obj in particles:
+                self.particle_grid.insert(obj)
+            for obj in killers:
+                self.killer_grid.insert(obj)
+        # Observation and target buffers, refilled in place every tick. A network with
+        # train_step_io owns them, so nothing is copied on the way in or out
+        input_dim = self.encoder.input_dim if self.encoder is not None else 2*self.n_cells
+        network = player.network
+        self._zero_copy = (
+            not old_network and hasattr(network, 'train_step_io') and network.obs.size == input_dim
+        )
+        if self._zero_copy:
+            self.coord_array, self.y_target = network.obs, network.target
+        else:
+            self.coord_array = np.zeros((input_dim, 1), dtype=np.float32)
+            self.y_target = np.zeros((2, 1), dtype=np.float32)
 
     def _validate(self):
         if self.render is False and self.player.use_network is False:
             raise ValueError("If render is False, use_network must be True")
+        if self.tick_rate is None and self.player.use_network is False:
+            raise ValueError("Playing yourself needs a tick_rate")
+        if self.render and self.renderer is not None:
+            raise ValueError("Rendered rounds draw on the main thread, a renderer is for headless capture")
 
     def on_init(self):
         pygame.init()
@@ -59,6 +126,12 @@ class App():
         pygame.display.set_caption('Super Simple Cell Simulator')
 
     def _render_graphics(self):
+        if self.renderer is not None:
+            self.renderer.submit(take_snapshot(self))
+            return
+        if self._dirty_sink is not None:
+            self._dirty_sink(take_snapshot(self))
+            return
         self._display_surf.fill((0, 0, 0))
         # Draw player
         pygame.draw.circle(
@@ -68,6 +141,13 @@ class App():
             self.player.size,
             self.player.fill,
         )
+        if self._stores:
+            for store in (self.particles, self.killers):
+                columns = (store.x.astype(int), store.y.astype(int), store.R, store.G, store.B, store.size, store.fill)
+                for x, y, r, g, b, size, fill in zip(*(column.tolist() for column in columns)):
+                    pygame.draw.circle(self._display_surf, (r, g, b), (x, y), size, fill)
+            pygame.display.flip()
+            return
         # Draw particles
         for obj in self.particles:
             pygame.draw.circle(
@@ -83,7 +163,18 @@ class App():
     # >>> UPDATED: pure PyTorch online step
     def _run_network(self, coord_array, y_target):
 
-        if self.old_network:
+        if self._zero_copy:
+            # coord_array and y_target are the network's own buffers
+            network = self.player.network
+            action = network.train_step_io() if self.train_network else network.predict_io()
+            dx_pred, dy_pred = float(action[0]), float(action[1])
+        elif not self.train_network:
+            if self.old_network:
+                dx_pred, dy_pred = self.player.network.feedforward(coord_array).ravel()
+            else:
+                pred = self.player.network.predict(coord_array)
+                dx_pred, dy_pred = float(pred[0]), float(pred[1])
+        elif self.old_network:
             # Train network
             activations = self.player.network.SGD((coord_array, y_target), 1, 1, self.eta)
             # Predicted movement
@@ -94,40 +185,88 @@ class App():
             dx_pred, dy_pred = float(pred[0]), float(pred[1])
 
         # Add small exploration noise (5%)
-        if np.random.rand() < 0.05:
-            dx_pred += np.random.uniform(-0.3, 0.3)
-            dy_pred += np.random.uniform(-0.3, 0.3)
+        if self.rng is None:
+            if np.random.rand() < 0.05:
+                dx_pred += np.random.uniform(-0.3, 0.3)
+                dy_pred += np.random.uniform(-0.3, 0.3)
+        elif self.rng.random() < 0.05:
+            dx_pred += self.rng.uniform(-0.3, 0.3)
+            dy_pred += self.rng.uniform(-0.3, 0.3)
 
         # Normalize prediction by ITS OWN norm
         pred_norm = math.hypot(dx_pred, dy_pred) + 1e-6
         dx_pred /= pred_norm
         dy_pred /= pred_norm
+        self.action = (dx_pred, dy_pred)
 
         # Move player
         self.player.x = (self.player.x + self.player.speed * dx_pred) % self.windowWidth
         self.player.y = (self.player.y + self.player.speed * dy_pred) % self.windowHeight
 
+    def _check_collisions(self):
+        # Returns the particles eaten and the killers hit this tick
+        if self._stores:
+            # Index arrays instead of sets, resolved in list order like the linear scan
+            x, y = self.player.x, self.player.y
+            eaten = np.flatnonzero(np.hypot(x - self.particles.x, y - self.particles.y) < 25)
+            for i in eaten:
+                self.particles.respawn(i)
+                self.player.level_up()
+            hit = np.flatnonzero(np.hypot(x - self.killers.x, y - self.killers.y) < 12)
+            for i in hit:
+                self.player.level_down(int(self.killers.level[i]))
+            return eaten, hit
+        if self.particle_grid is None:
+            eaten = [
+                obj for obj in self.particles
+                if coll(self.player, obj, self.windowWidth, self.windowHeight, self._respawn_rng)
+            ]
+            hit = [obj for obj in self.killers if fight(self.player, obj, self.windowWidth, self.windowHeight)]
+        else:
+            x, y = self.player.x, self.player.y
+            eaten = [
+                obj for obj in self.particle_grid.candidates(x, y, 25)
+                if coll(self.player, obj, self.windowWidth, self.windowHeight, self._respawn_rng)
+            ]
+            hit = [
+                obj for obj in self.killer_grid.candidates(x, y, 12)
+                if fight(self.player, obj, self.windowWidth, self.windowHeight)
+            ]
+        return set(eaten), set(hit)
+
     def _update_npc_positions(self):
+        if self._stores:
+            return self._update_store_positions()
+
+        if self.encoder is not None:
+            eaten, hit = self._check_collisions()
+            return self.encoder.encode(
+                self.player, self.particle_grid, self.killer_grid, eaten, hit, out=(self.coord_array, self.y_target)
+            )
+
         # Input = relative positions of objects (normalized)
-        coord_array = np.zeros((2*self.n_cells, 1), dtype=np.float32)
+        coord_array = self.coord_array
         coord_array[0] = self.player.x / self.windowWidth
         coord_array[1] = self.player.y / self.windowHeight
 
-        scores = []
-        rel_positions = []
+        # Running sums for the target, in the order the entities are visited
+        total = dx_target = dy_target = 0
         count = 1
 
         diag = math.hypot(self.windowWidth, self.windowHeight)
 
+        eaten, hit = self._check_collisions()
+
         for obj in self.particles:
-            collided = coll(self.player, obj, self.windowWidth, self.windowHeight)
+            collided = obj in eaten
 
             dx = (obj.x - self.player.x) / diag
             dy = (obj.y - self.player.y) / diag
-            rel_positions.append((dx, dy))
 
             score = 1.0 if collided else 0.1
-            scores.append(score)
+            total += abs(score)
+            dx_target += dx * score
+            dy_target += dy * score
 
             coord_array[2*count] = dx
             coord_array[2*count+1] = dy
@@ -137,14 +276,15 @@ class App():
             obj.moveUp()
 
         for obj in self.killers:
-            collided = fight(self.player, obj, self.windowWidth, self.windowHeight)
+            collided = obj in hit
 
             dx = (obj.x - self.player.x) / diag
             dy = (obj.y - self.player.y) / diag
-            rel_positions.append((dx, dy))
 
             score = -1.0 if collided else -0.2  # negative away from killers
-            scores.append(score)
+            total += abs(score)
+            dx_target += dx * score
+            dy_target += dy * score
 
             coord_array[2*count] = dx
             coord_array[2*count+1] = dy
@@ -154,16 +294,57 @@ class App():
             obj.moveUp()
 
         # >>> NEW: compute target ONCE after loops
-        total = sum(abs(s) for s in scores) + 1e-6
-        dx_target = sum(dx * s for (dx, _dy), s in zip(rel_positions, scores)) / total
-        dy_target = sum(dy * s for (_dx, dy), s in zip(rel_positions, scores)) / total
+        total += 1e-6
+        dx_target /= total
+        dy_target /= total
 
         # L2 normalize for a unit direction
         norm = math.hypot(dx_target, dy_target) + 1e-6
-        y_target = np.array([[dx_target / norm], [dy_target / norm]], dtype=np.float32)
+        y_target = self.y_target
+        y_target[0] = dx_target / norm
+        y_target[1] = dy_target / norm
 
         return coord_array, y_target
 
+    def _update_store_positions(self):
+        # _update_npc_positions over EntityStore arrays, same layout and target
+        particles, killers = self.particles, self.killers
+        eaten, hit = self._check_collisions()
+        if self.encoder is not None:
+            observation = self.encoder.encode_arrays(
+                self.player, particles, killers, eaten, hit, out=(self.coord_array, self.y_target)
+            )
+        else:
+            x, y = self.player.x, self.player.y
+            diag = math.hypot(self.windowWidth, self.windowHeight)
+            n = len(particles)
+            coord = self.coord_array.reshape(-1)
+            coord[0] = x / self.windowWidth
+            coord[1] = y / self.windowHeight
+
+            dx = np.concatenate(((particles.x - x) / diag, (killers.x - x) / diag))
+            dy = np.concatenate(((particles.y - y) / diag, (killers.y - y) / diag))
+            coord[2::2] = dx
+            coord[3::2] = dy
+
+            scores = np.empty(len(dx))
+            scores[:n] = 0.1
+            scores[eaten] = 1.0
+            scores[n:] = -0.2  # negative away from killers
+            scores[n + hit] = -1.0
+
+            total = np.abs(scores).sum() + 1e-6
+            dx_target = float(dx @ scores) / total
+            dy_target = float(dy @ scores) / total
+            norm = math.hypot(dx_target, dy_target) + 1e-6
+            self.y_target[0] = dx_target / norm
+            self.y_target[1] = dy_target / norm
+            observation = self.coord_array, self.y_target
+
+        particles.step()
+        killers.step()
+        return observation
+
     def on_render(self):
         if isinstance(self.player.x, np.ndarray):
             self.player.x = float(self.player.x[0])
@@ -177,38 +358,107 @@ class App():
         if self.player.level == 0:
             self._running = False
 
+    def on_cleanup(self):
+        pygame.quit()
+
+    def _handle_keys(self):
+        keys = self._keys
+        if keys is None:
+            return
+        if (keys[K_RIGHT]):
+            self.player.moveRight()
+        if (keys[K_LEFT]):
+            self.player.moveLeft()
+        if (keys[K_UP]):
+            self.player.moveUp()
+        if (keys[K_DOWN]):
+            self.player.moveDown()
+
+    def _tick(self):
         if self.render:
+            self._handle_keys()
+
+        self.round_count += 1
+        if self.round_count >= self.round_limit:
+            self._running = False
+
+        self.on_render()
+
+        if self.recorder is not None:
+            self.recorder.record(self, self.action)
+
+        if self.renderer is not None and not self.render and self.round_count % self.renderer.every == 0:
             self._render_graphics()
 
-    def on_cleanup(self):
-        pygame.quit()
+    def run_until(self, tick):
+        '''Play headless up to round ``tick`` or the end of the round, returning whether it is still running.
+
+        All state stays on the App, so a round can be played in segments by
+        calling this with growing ticks. A round played in segments has no
+        single start and end, so recorders and renderers are refused.
+        '''
+        if self.render:
+            raise ValueError("run_until only plays headless rounds")
+        if self.recorder is not None or self.renderer is not None:
+            raise ValueError("run_until plays rounds without a recorder or renderer")
+        if self.profiler is not None:
+            self.profiler.begin()
+        start = self.round_count
+        while self._running and self.round_count < tick:
+            self._tick()
+        if self.profiler is not None:
+            self.profiler.end(self.round_count - start)
+        return self._running
 
     def run(self):
+        if self.profiler is not None:
+            self.profiler.begin()
+
+        if self.recorder is not None:
+            self.recorder.begin(self)
+
         if self.render:
             if self.on_init() is False:
                 self._running = False
+            clock = pygame.time.Clock()
+            lag = 0.0
 
         while(self._running):
-            if self.render:
-                time.sleep(self.time_sleep)
-                pygame.event.pump()
-                keys = pygame.key.get_pressed()
-                if (keys[K_RIGHT]):
-                    self.player.moveRight()
-                if (keys[K_LEFT]):
-                    self.player.moveLeft()
-                if (keys[K_UP]):
-                    self.player.moveUp()
-                if (keys[K_DOWN]):
-                    self.player.moveDown()
-                if (keys[K_ESCAPE]):
-                    self._running = False
-
-            self.round_count += 1
-            if self.round_count >= self.round_limit:
+            if not self.render:
+                self._tick()
+                continue
+
+            pygame.event.pump()
+            self._keys = pygame.key.get_pressed()
+            if (self._keys[K_ESCAPE]):
                 self._running = False
 
-            self.on_render()
+            if self.tick_rate:
+                # Fixed timestep: run the ticks owed since the last frame, capped so a slow frame can't snowball
+                lag = min(lag + clock.get_time() / 1000, 0.25)
+                n_ticks = int(lag * self.tick_rate)
+                lag -= n_ticks / self.tick_rate
+                for _ in range(n_ticks):
+                    if not self._running:
+                        break
+                    self._tick()
+            else:
+                # As fast as possible, stopping only to draw max_fps frames per second
+                deadline = time.perf_counter() + 1.0 / self.max_fps
+                while self._running and time.perf_counter() < deadline:
+                    self._tick()
+
+            self._render_graphics()
+            clock.tick(self.max_fps)
+
+        if self.recorder is not None:
+            self.recorder.close()
+
+        if self.renderer is not None:
+            self.renderer.close()
 
         if self.render:
             self.on_cleanup()
+
+        if self.profiler is not None:
+            self.profiler.end(self.round_count)